@@ -10,6 +10,28 @@ CHANNEL_ID = os.getenv('CHANNEL_ID')  # ID вашего канала
 CHANNEL_URL = os.getenv('CHANNEL_URL')
 ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',')]
 ADMIN_USERNAME = os.getenv('ADMIN_USERNAME')  # Username без @ 
+# Сколько секунд помнить результат проверки подписки на канал
+MEMBERSHIP_CACHE_TTL = int(os.getenv('MEMBERSHIP_CACHE_TTL', '600'))  # подписан
+MEMBERSHIP_CACHE_NEGATIVE_TTL = int(os.getenv('MEMBERSHIP_CACHE_NEGATIVE_TTL', '60'))  # не подписан
+# Запросы к БД дольше этого порога (мс) пишутся в лог как медленные
+DB_SLOW_QUERY_MS = int(os.getenv('DB_SLOW_QUERY_MS', '100'))
+# Фоновое обслуживание БД (utils/maintenance.py)
+MAINTENANCE_INTERVAL = int(os.getenv('MAINTENANCE_INTERVAL', '3600'))  # секунд между запусками
+ORPHAN_TIMER_HOURS = int(os.getenv('ORPHAN_TIMER_HOURS', '12'))  # таймер старше — забыт
+PENDING_USER_TTL_DAYS = int(os.getenv('PENDING_USER_TTL_DAYS', '30'))  # срок жизни заявки
+# Сколько секунд ждать ответа YouTube Data API
+YOUTUBE_TIMEOUT = float(os.getenv('YOUTUBE_TIMEOUT', '10'))
+# Каталог видео по категориям (utils/video_catalog.py)
+VIDEO_CACHE_TTL = int(os.getenv('VIDEO_CACHE_TTL', str(6 * 3600)))  # секунд до фонового обновления
+VIDEO_CATALOG_SIZE = int(os.getenv('VIDEO_CATALOG_SIZE', '50'))  # видео за один запрос (максимум API — 50)
+VIDEO_WARMUP_TIMEOUT = int(os.getenv('VIDEO_WARMUP_TIMEOUT', '30'))  # предел прогрева при запуске, секунд
+VIDEO_MAX_DURATION = int(os.getenv('VIDEO_MAX_DURATION', '1200'))  # более длинные видео (трансляции) не показываем, секунд
+VIDEO_METADATA_TTL = int(os.getenv('VIDEO_METADATA_TTL', str(7 * 24 * 3600)))  # срок жизни метаданных видео, секунд
+# Квота YouTube Data API (utils/quota.py): единиц в сутки по тихоокеанскому времени
+YOUTUBE_DAILY_QUOTA = int(os.getenv('YOUTUBE_DAILY_QUOTA', '10000'))
+YOUTUBE_QUOTA_RESERVE = int(os.getenv('YOUTUBE_QUOTA_RESERVE', '1000'))  # только для пустых категорий
+YOUTUBE_BURST = int(os.getenv('YOUTUBE_BURST', '10'))  # запросов подряд
+YOUTUBE_RATE_PER_MIN = float(os.getenv('YOUTUBE_RATE_PER_MIN', '10'))  # пополнение, запросов в минуту
 
 if not CHANNEL_ID:
     print("❌ Ошибка: CHANNEL_ID не установлен в .env файле")
@@ -1,21 +1,406 @@
 import sqlite3
 import logging
-from typing import Optional, Dict, List
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Tuple
 from datetime import datetime
-from config import ADMIN_IDS
+from config import ADMIN_IDS, DB_SLOW_QUERY_MS
+from utils.query_stats import QueryStats
+
+# Версионированные миграции схемы. Номер версии = позиция в списке + 1,
+# применённая версия хранится в PRAGMA user_version.
+# Уже выпущенные миграции не меняются — новые добавляются в конец.
+MIGRATIONS = [
+    # 1: базовые таблицы (IF NOT EXISTS — для баз, созданных до миграций)
+    [
+        '''CREATE TABLE IF NOT EXISTS pending_users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            request_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS allowed_users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            granted_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS tasks (
+            task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            task_name TEXT,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES allowed_users(user_id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS task_timers (
+            timer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER,
+            user_id INTEGER,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            duration INTEGER,
+            FOREIGN KEY (task_id) REFERENCES tasks(task_id),
+            FOREIGN KEY (user_id) REFERENCES allowed_users(user_id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS assigned_tasks (
+            task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            assigned_by INTEGER,
+            assigned_to INTEGER,
+            task_name TEXT,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed INTEGER DEFAULT 0,
+            FOREIGN KEY (assigned_by) REFERENCES allowed_users(user_id),
+            FOREIGN KEY (assigned_to) REFERENCES allowed_users(user_id)
+        )''',
+    ],
+    # 2: индексы под реальные запросы
+    [
+        # SUM(duration) по заданию читается прямо из индекса
+        'CREATE INDEX IF NOT EXISTS idx_task_timers_task ON task_timers(task_id, duration)',
+        # Поиск запущенного таймера
+        '''CREATE INDEX IF NOT EXISTS idx_task_timers_open
+           ON task_timers(task_id, user_id) WHERE end_time IS NULL''',
+        '''CREATE INDEX IF NOT EXISTS idx_assigned_tasks_user_created
+           ON assigned_tasks(assigned_to, created_at)''',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_user_created ON tasks(user_id, created_at)',
+    ],
+    # 3: накопленное время по заданию, чтобы список заданий не суммировал таймеры
+    [
+        'ALTER TABLE tasks ADD COLUMN total_duration INTEGER NOT NULL DEFAULT 0',
+        '''UPDATE tasks SET total_duration = COALESCE((
+               SELECT SUM(duration) FROM task_timers
+               WHERE task_timers.task_id = tasks.task_id
+                 AND task_timers.user_id = tasks.user_id
+           ), 0)''',
+        # Остановка таймера (любым путём: stop_timer, очередь записи) в той же
+        # транзакции добавляет длительность к заданию
+        '''CREATE TRIGGER IF NOT EXISTS task_timers_total_duration
+           AFTER UPDATE OF duration ON task_timers
+           WHEN OLD.duration IS NULL AND NEW.duration IS NOT NULL
+           BEGIN
+               UPDATE tasks SET total_duration = total_duration + NEW.duration
+               WHERE task_id = NEW.task_id AND user_id = NEW.user_id;
+           END''',
+    ],
+    # 4: дневные сводки для статистики (дни по UTC, как datetime('now')).
+    # Триггеры обновляют их в той же транзакции, что и исходное событие,
+    # поэтому статистика не перечитывает сырые таймеры
+    [
+        '''CREATE TABLE IF NOT EXISTS daily_stats (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            practice_seconds INTEGER NOT NULL DEFAULT 0,
+            tasks_completed INTEGER NOT NULL DEFAULT 0,
+            access_grants INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_daily_stats_day ON daily_stats(day)',
+        '''INSERT INTO daily_stats (user_id, day, practice_seconds)
+           SELECT user_id, date(end_time), SUM(duration) FROM task_timers
+           WHERE duration IS NOT NULL
+           GROUP BY user_id, date(end_time)''',
+        # Время выполнения заданий не хранилось — старые относим ко дню создания
+        '''INSERT INTO daily_stats (user_id, day, tasks_completed)
+           SELECT assigned_to, date(created_at), COUNT(*) FROM assigned_tasks
+           WHERE completed = 1
+           GROUP BY assigned_to, date(created_at)
+           ON CONFLICT (user_id, day) DO UPDATE
+           SET tasks_completed = tasks_completed + excluded.tasks_completed''',
+        '''INSERT INTO daily_stats (user_id, day, access_grants)
+           SELECT user_id, date(granted_time), 1 FROM allowed_users WHERE true
+           ON CONFLICT (user_id, day) DO UPDATE
+           SET access_grants = access_grants + excluded.access_grants''',
+        '''CREATE TRIGGER IF NOT EXISTS daily_stats_practice
+           AFTER UPDATE OF duration ON task_timers
+           WHEN OLD.duration IS NULL AND NEW.duration IS NOT NULL
+           BEGIN
+               INSERT INTO daily_stats (user_id, day, practice_seconds)
+               VALUES (NEW.user_id, date(NEW.end_time), NEW.duration)
+               ON CONFLICT (user_id, day) DO UPDATE
+               SET practice_seconds = practice_seconds + excluded.practice_seconds;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS daily_stats_task_completed
+           AFTER UPDATE OF completed ON assigned_tasks
+           WHEN OLD.completed = 0 AND NEW.completed = 1
+           BEGIN
+               INSERT INTO daily_stats (user_id, day, tasks_completed)
+               VALUES (NEW.assigned_to, date('now'), 1)
+               ON CONFLICT (user_id, day) DO UPDATE
+               SET tasks_completed = tasks_completed + 1;
+           END''',
+        # BEFORE: INSERT OR REPLACE уже имеющегося пользователя не считается новой выдачей
+        '''CREATE TRIGGER IF NOT EXISTS daily_stats_access_grant
+           BEFORE INSERT ON allowed_users
+           WHEN NOT EXISTS (SELECT 1 FROM allowed_users WHERE user_id = NEW.user_id)
+           BEGIN
+               INSERT INTO daily_stats (user_id, day, access_grants)
+               VALUES (NEW.user_id, date('now'), 1)
+               ON CONFLICT (user_id, day) DO UPDATE
+               SET access_grants = access_grants + 1;
+           END''',
+    ],
+    # 5: каталог видео по категориям упражнений (кэш YouTube)
+    [
+        '''CREATE TABLE IF NOT EXISTS video_cache (
+            category TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            video_id TEXT NOT NULL,
+            title TEXT,
+            thumbnail TEXT,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (category, position)
+        ) WITHOUT ROWID''',
+    ],
+    # 6: расход квоты YouTube Data API по дням (день — по тихоокеанскому времени)
+    [
+        '''CREATE TABLE IF NOT EXISTS youtube_quota (
+            day TEXT PRIMARY KEY,
+            units INTEGER NOT NULL DEFAULT 0,
+            calls INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            throttled INTEGER NOT NULL DEFAULT 0
+        )''',
+    ],
+    # 7: курсор YouTube для догрузки следующей страницы результатов категории
+    [
+        'ALTER TABLE video_cache ADD COLUMN next_page_token TEXT',
+    ],
+    # 8: метаданные видео (videos.list) по ID — длительность, просмотры, канал
+    [
+        '''CREATE TABLE IF NOT EXISTS video_metadata (
+            video_id TEXT PRIMARY KEY,
+            duration INTEGER,
+            view_count INTEGER,
+            channel_title TEXT,
+            fetched_at REAL NOT NULL
+        ) WITHOUT ROWID''',
+    ],
+    # 9: библиотека упражнений от администратора с полнотекстовым поиском.
+    # exercises_fts — внешний индекс FTS5 над exercises, синхронизируется триггерами
+    [
+        '''CREATE TABLE IF NOT EXISTS exercises (
+            exercise_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            video_url TEXT,
+            video_file_id TEXT,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_exercises_category ON exercises(category, exercise_id)',
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS exercises_fts USING fts5(
+            title, description,
+            content='exercises', content_rowid='exercise_id',
+            tokenize='unicode61 remove_diacritics 2'
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS exercises_fts_insert AFTER INSERT ON exercises BEGIN
+               INSERT INTO exercises_fts (rowid, title, description)
+               VALUES (NEW.exercise_id, NEW.title, NEW.description);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS exercises_fts_delete AFTER DELETE ON exercises BEGIN
+               INSERT INTO exercises_fts (exercises_fts, rowid, title, description)
+               VALUES ('delete', OLD.exercise_id, OLD.title, OLD.description);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS exercises_fts_update AFTER UPDATE OF title, description ON exercises BEGIN
+               INSERT INTO exercises_fts (exercises_fts, rowid, title, description)
+               VALUES ('delete', OLD.exercise_id, OLD.title, OLD.description);
+               INSERT INTO exercises_fts (rowid, title, description)
+               VALUES (NEW.exercise_id, NEW.title, NEW.description);
+           END''',
+    ],
+    # 10: таймеры личных (tasks) и назначенных (assigned_tasks) заданий различаются
+    # колонкой kind — у таблиц свои последовательности task_id, и номера совпадают
+    [
+        "ALTER TABLE task_timers ADD COLUMN kind TEXT NOT NULL DEFAULT 'own'",
+        # Старые таймеры: назначенным считаем таймер, у которого нет личного задания
+        # с тем же номером; при совпадении номеров владельца уже не определить
+        '''UPDATE task_timers SET kind = 'assigned'
+           WHERE EXISTS (SELECT 1 FROM assigned_tasks a
+                         WHERE a.task_id = task_timers.task_id AND a.assigned_to = task_timers.user_id)
+             AND NOT EXISTS (SELECT 1 FROM tasks t
+                             WHERE t.task_id = task_timers.task_id AND t.user_id = task_timers.user_id)''',
+        'DROP TRIGGER IF EXISTS task_timers_total_duration',
+        '''CREATE TRIGGER task_timers_total_duration
+           AFTER UPDATE OF duration ON task_timers
+           WHEN OLD.duration IS NULL AND NEW.duration IS NOT NULL AND NEW.kind = 'own'
+           BEGIN
+               UPDATE tasks SET total_duration = total_duration + NEW.duration
+               WHERE task_id = NEW.task_id AND user_id = NEW.user_id;
+           END''',
+        '''UPDATE tasks SET total_duration = COALESCE((
+               SELECT SUM(duration) FROM task_timers
+               WHERE task_timers.task_id = tasks.task_id
+                 AND task_timers.user_id = tasks.user_id
+                 AND task_timers.kind = 'own'
+           ), 0)''',
+    ],
+]
+
+class _TimedCursor(sqlite3.Cursor):
+    """Курсор, который замеряет время каждого запроса вместе с чтением его строк.
+
+    У SELECT основная работа идёт в fetch*, поэтому замер записывается, когда
+    строки прочитаны до конца, на курсоре выполнен следующий запрос или он закрыт.
+    """
+    _sql = None
+    _elapsed = 0.0
+
+    def _finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            self.connection.query_stats.record(sql, self._elapsed)
+
+    def _timed(self, func, *args):
+        started = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception:
+            self._elapsed += time.perf_counter() - started
+            self._finish()
+            raise
+        self._elapsed += time.perf_counter() - started
+        return result
+
+    def _run(self, sql, func, *args):
+        self._finish()
+        self._sql, self._elapsed = sql, 0.0
+        result = self._timed(func, sql, *args)
+        if self.description is None:
+            # Запрос без строк результата — замер готов сразу
+            self._finish()
+        return result
+
+    def execute(self, sql, parameters=()):
+        return self._run(sql, super().execute, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(sql, super().executemany, seq_of_parameters)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Курсор бросили, не дочитав (fetchone у execute_query) — учитываем прочитанное
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class _InstrumentedConnection(sqlite3.Connection):
+    """Соединение, курсоры которого по умолчанию пишут статистику запросов"""
+    query_stats = None
+
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        # На commit приходится fsync — его тоже учитываем
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            self.query_stats.record('COMMIT', time.perf_counter() - started)
+
 
 class Database:
+    # Настройки соединения применяются один раз при открытии.
+    # WAL + synchronous=NORMAL убирают fsync журнала отката на каждый commit
+    PRAGMAS = {
+        # Действует только для новой базы и до перевода в WAL: даёт обслуживанию освобождать
+        # страницы порциями через incremental_vacuum
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,          # мс ожидания блокировки вместо ошибки
+        "cache_size": -16384,          # 16 МБ кэша страниц (в КиБ)
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    }
+    STATEMENT_CACHE_SIZE = 256  # Подготовленные запросы, которые держит sqlite3
+
+    # Запросы таймеров: хендлеры ставят их в очередь групповой записи (write)
+    START_TIMER_QUERY = '''INSERT INTO task_timers (task_id, user_id, kind, start_time)
+                           VALUES (?, ?, ?, datetime('now'))'''
+    STOP_TIMER_QUERY = '''UPDATE task_timers 
+                          SET end_time = datetime('now'),
+                              duration = CAST(
+                                  (JULIANDAY(datetime('now')) - JULIANDAY(start_time)) * 86400 
+                                  AS INTEGER
+                              )
+                          WHERE task_id = ? AND user_id = ? AND kind = ? AND end_time IS NULL'''
+    COMPLETE_ASSIGNED_TASK_QUERY = '''UPDATE assigned_tasks 
+                                      SET completed = 1
+                                      WHERE task_id = ? AND assigned_to = ?'''
+
     def __init__(self, db_path: str = "logoped_bot.db"):
         self.db_path = db_path
         self.conn = None
-        self._tables_created = False  # Флаг для отслеживания создания таблиц
-        self.create_tables()
+        # Все обращения к SQLite из хендлеров идут через один поток,
+        # чтобы не блокировать event loop и не делить соединение между потоками
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        # Очередь отложенной записи (см. start_writer): (query, params, future)
+        self._write_buffer = []
+        self._writer_task = None
+        self._write_batch_ms = 0
+        self._write_batch_size = 0
+        # Индекс пользователей с доступом: проверка доступа без запроса к БД.
+        # Обновляется при каждом изменении allowed_users через методы класса
+        self._allowed_users = set()
+        # Реестр запущенных таймеров: (user_id, kind, task_id) -> время старта.
+        # Восстанавливается из task_timers при старте, отвечает без обращения к БД
+        self._active_timers = {}
+        # Время выполнения запросов по отпечаткам SQL (см. /db_stats)
+        self.query_stats = QueryStats(DB_SLOW_QUERY_MS)
+        self.migrate()
+        self.load_allowed_users()
+        self.load_active_timers()
     
     def connect(self):
         if not self.conn:
             try:
-                self.conn = sqlite3.connect(self.db_path)
+                self.conn = sqlite3.connect(
+                    self.db_path,
+                    check_same_thread=False,
+                    cached_statements=self.STATEMENT_CACHE_SIZE,
+                    factory=_InstrumentedConnection
+                )
+                self.conn.query_stats = self.query_stats
                 self.conn.row_factory = sqlite3.Row
+                for name, value in self.PRAGMAS.items():
+                    self.conn.execute(f"PRAGMA {name} = {value}")
             except Exception as e:
                 logging.error(f"Ошибка подключения к БД: {e}")
                 raise
@@ -40,78 +425,183 @@ class Database:
                 self.conn.rollback()
             logging.error(f"Ошибка выполнения запроса: {e}")
             raise
-    
-    def create_tables(self):
-        if self._tables_created:  # Проверяем, были ли уже созданы таблицы
-            return
-            
+
+    @contextmanager
+    def transaction(self):
+        """Выполняет несколько запросов одной транзакцией с одним commit"""
         self.connect()
+        cursor = self.conn.cursor()
         try:
-            self.execute_query('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                task_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                task_name TEXT,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES allowed_users(user_id)
-            )
-            ''')
-            
-            self.execute_query('''
-            CREATE TABLE IF NOT EXISTS task_timers (
-                timer_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                task_id INTEGER,
-                user_id INTEGER,
-                start_time TIMESTAMP,
-                end_time TIMESTAMP,
-                duration INTEGER,
-                FOREIGN KEY (task_id) REFERENCES tasks(task_id),
-                FOREIGN KEY (user_id) REFERENCES allowed_users(user_id)
-            )
-            ''')
-            
-            self.execute_query('''
-            CREATE TABLE IF NOT EXISTS assigned_tasks (
-                task_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                assigned_by INTEGER,
-                assigned_to INTEGER,
-                task_name TEXT,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed INTEGER DEFAULT 0,
-                FOREIGN KEY (assigned_by) REFERENCES allowed_users(user_id),
-                FOREIGN KEY (assigned_to) REFERENCES allowed_users(user_id)
-            )
-            ''')
-            
+            cursor.execute('BEGIN IMMEDIATE')
+            yield cursor
             self.conn.commit()
-            print("✅ Таблицы успешно созданы")
-            
-        except Exception as e:
-            print(f"Ошибка создания таблиц: {e}")
+        except Exception:
+            self.conn.rollback()
             raise
-        finally:
-            self.close()
-        
-        self._tables_created = True  # Устанавливаем флаг после создания
 
-    def is_user_allowed(self, user_id: int) -> bool:
-        """Проверяет, имеет ли пользователь доступ"""
+    def _execute_batch(self, statements: list) -> list:
+        """Выполняет пачку записей одной транзакцией, возвращает ошибку по каждому запросу"""
         try:
-            # Сначала проверяем, является ли пользователь админом
-            if user_id in ADMIN_IDS:  # Добавляем импорт ADMIN_IDS из config
-                return True
-            
-            # Если не админ, проверяем в базе данных
-            result = self.execute_query(
-                'SELECT 1 FROM allowed_users WHERE user_id = ?',
-                (user_id,)
-            ).fetchone()
-            return bool(result)
+            with self.transaction() as cursor:
+                for query, params in statements:
+                    cursor.execute(query, params or ())
+            return [None] * len(statements)
         except Exception as e:
-            logging.error(f"Ошибка проверки доступа пользователя {user_id}: {e}")
-            return False
+            # Одна ошибочная запись не должна терять всю пачку — повторяем по одной
+            logging.error(f"Ошибка пакетной записи, выполняем запросы по одному: {e}")
+            errors = []
+            for query, params in statements:
+                try:
+                    self.execute_query(query, params)
+                    errors.append(None)
+                except Exception as error:
+                    errors.append(error)
+            return errors
+
+    async def call(self, func, *args, **kwargs):
+        """Выполняет синхронный метод БД в потоке базы данных, не блокируя event loop"""
+        # Отложенные записи должны попасть в базу раньше следующего запроса
+        if self._write_buffer:
+            await self.flush()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def execute(self, query: str, params: tuple = None) -> int:
+        """Асинхронно выполняет запрос на изменение и возвращает число затронутых строк"""
+        return await self.call(lambda: self.execute_query(query, params).rowcount)
+
+    async def fetchone(self, query: str, params: tuple = None) -> Optional[sqlite3.Row]:
+        """Асинхронно выполняет запрос и возвращает первую строку"""
+        return await self.call(lambda: self.execute_query(query, params).fetchone())
+
+    async def fetchall(self, query: str, params: tuple = None) -> List[sqlite3.Row]:
+        """Асинхронно выполняет запрос и возвращает все строки"""
+        return await self.call(lambda: self.execute_query(query, params).fetchall())
+
+    async def write(self, query: str, params: tuple = None, wait: bool = False):
+        """Ставит запрос на изменение в очередь групповой записи.
+
+        Запросы из очереди коммитятся одной транзакцией раз в batch_ms
+        или по набору batch_size штук. С wait=True вызов дожидается commit
+        (и получает исключение, если запрос не выполнился). Если очередь
+        не запущена, запрос выполняется сразу.
+        """
+        if self._writer_task is None:
+            await self.execute(query, params)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        # Ошибка уже залогирована в _execute_batch — не ругаемся на неполученное исключение
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._write_buffer.append((query, params, future))
+        self._write_pending.set()
+        if len(self._write_buffer) >= self._write_batch_size:
+            self._write_full.set()
+        if wait:
+            await future
+
+    async def flush(self):
+        """Немедленно коммитит всё, что накопилось в очереди записи"""
+        if not self._write_buffer:
+            return
+        batch, self._write_buffer = self._write_buffer, []
+        if self._writer_task is not None:
+            self._write_pending.clear()
+            self._write_full.clear()
+
+        loop = asyncio.get_running_loop()
+        try:
+            errors = await loop.run_in_executor(
+                self._executor,
+                self._execute_batch,
+                [(query, params) for query, params, _ in batch]
+            )
+        except Exception as e:
+            errors = [e] * len(batch)
+
+        for (_, _, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    async def start_writer(self, batch_ms: int = 50, batch_size: int = 100):
+        """Включает групповую запись: один commit на пачку вместо commit на запрос"""
+        if self._writer_task is not None:
+            return
+        self._write_batch_ms = batch_ms
+        self._write_batch_size = batch_size
+        self._write_pending = asyncio.Event()
+        self._write_full = asyncio.Event()
+        self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def stop_writer(self):
+        """Останавливает групповую запись, предварительно сбросив очередь"""
+        if self._writer_task is None:
+            return
+        self._writer_task.cancel()
+        try:
+            await self._writer_task
+        except asyncio.CancelledError:
+            pass
+        self._writer_task = None
+        await self.flush()
+
+    async def _writer_loop(self):
+        while True:
+            await self._write_pending.wait()
+            try:
+                # Ждём окно группировки или заполнения пачки — что наступит раньше
+                await asyncio.wait_for(
+                    self._write_full.wait(), timeout=self._write_batch_ms / 1000
+                )
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка групповой записи: {e}")
+
+    def shutdown(self):
+        """Дожидается завершения запросов и закрывает соединение"""
+        self._executor.shutdown(wait=True)
+        self.close()
+    
+    def migrate(self):
+        """Применяет к базе все миграции новее её PRAGMA user_version"""
+        self.connect()
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= len(MIGRATIONS):
+            return
+
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            try:
+                # Каждая миграция применяется целиком или не применяется вовсе
+                with self.transaction() as cursor:
+                    for statement in statements:
+                        cursor.execute(statement)
+                    cursor.execute(f'PRAGMA user_version = {number}')
+            except Exception as e:
+                logging.error(f"Ошибка применения миграции {number}: {e}")
+                raise
+
+        print(f"✅ Схема БД обновлена до версии {len(MIGRATIONS)}")
+
+    def load_allowed_users(self):
+        """Загружает ID пользователей с доступом в память"""
+        rows = self.execute_query('SELECT user_id FROM allowed_users').fetchall()
+        self._allowed_users = {row[0] for row in rows}
+
+    def is_user_allowed(self, user_id: int) -> bool:
+        """Проверяет, имеет ли пользователь доступ (без обращения к БД)"""
+        # Админы имеют доступ всегда
+        if user_id in ADMIN_IDS:
+            return True
+        return user_id in self._allowed_users
 
     def add_allowed_user(self, user_id: int, username: str = None, full_name: str = None) -> bool:
         try:
@@ -131,13 +621,11 @@ class Database:
                    (user_id, username, full_name) VALUES (?, ?, ?)''',
                 (user_id, username, full_name)
             )
-            self.conn.commit()
+            self._allowed_users.add(user_id)
             return True
         except Exception as e:
             logging.error(f"Ошибка добавления пользователя {user_id}: {e}")
             return False
-        finally:
-            self.close()
 
     def remove_allowed_user(self, user_id: int) -> bool:
         try:
@@ -145,21 +633,110 @@ class Database:
                 'DELETE FROM allowed_users WHERE user_id = ?',
                 (user_id,)
             )
+            self._allowed_users.discard(user_id)
             return True
         except Exception as e:
             logging.error(f"Ошибка удаления пользователя {user_id}: {e}")
             return False
 
+    # Колонки, которые отдаёт get_users_page (заодно белый список таблиц)
+    USER_PAGE_COLUMNS = {
+        'allowed_users': 'user_id, username, full_name',
+        'pending_users': 'user_id, username, full_name, request_time',
+    }
+
+    def get_users_page(self, table: str, after: int = None, before: int = None,
+                       limit: int = 10, exclude: List[int] = ()) -> Tuple[List[sqlite3.Row], bool, bool]:
+        """Страница пользователей с keyset-пагинацией по user_id.
+
+        after/before — user_id последней/первой строки соседней страницы.
+        Читается не больше limit + 1 строк по первичному ключу.
+        Возвращает (строки, есть ли предыдущая страница, есть ли следующая).
+        """
+        columns = self.USER_PAGE_COLUMNS[table]
+        conditions, params = [], []
+        if exclude:
+            conditions.append(f"user_id NOT IN ({','.join('?' * len(exclude))})")
+            params.extend(exclude)
+        if before is not None:
+            conditions.append('user_id < ?')
+            params.append(before)
+        elif after is not None:
+            conditions.append('user_id > ?')
+            params.append(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = 'DESC' if before is not None else 'ASC'
+        params.append(limit + 1)
+
+        rows = self.execute_query(
+            f'SELECT {columns} FROM {table} {where} ORDER BY user_id {order} LIMIT ?',
+            tuple(params)
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        if before is not None:
+            return rows[::-1], has_more, True
+        return rows, after is not None, has_more
+
+    def _filter_pending(self, cursor: sqlite3.Cursor, user_ids: Optional[List[int]]) -> str:
+        """Готовит условие отбора заявок; ID передаются через временную таблицу"""
+        if user_ids is None:
+            return ''
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS bulk_ids (user_id INTEGER PRIMARY KEY)')
+        cursor.execute('DELETE FROM bulk_ids')
+        cursor.executemany(
+            'INSERT OR IGNORE INTO bulk_ids (user_id) VALUES (?)',
+            [(user_id,) for user_id in user_ids]
+        )
+        return ' WHERE user_id IN (SELECT user_id FROM bulk_ids)'
+
+    def grant_pending_users(self, user_ids: List[int] = None) -> List[int]:
+        """Одобряет заявки одной транзакцией: переносит их из pending_users в allowed_users.
+
+        Без user_ids одобряются все ожидающие. Возвращает ID одобренных пользователей.
+        """
+        with self.transaction() as cursor:
+            where = self._filter_pending(cursor, user_ids)
+            granted = [
+                row[0] for row in cursor.execute('SELECT user_id FROM pending_users' + where)
+            ]
+            cursor.execute(
+                '''INSERT OR REPLACE INTO allowed_users (user_id, username, full_name)
+                   SELECT user_id, username, full_name FROM pending_users''' + where
+            )
+            cursor.execute('DELETE FROM pending_users' + where)
+        self._allowed_users.update(granted)
+        return granted
+
+    def deny_pending_users(self, user_ids: List[int] = None) -> List[int]:
+        """Отклоняет заявки одной транзакцией. Без user_ids — все ожидающие.
+        Возвращает ID пользователей, чьи заявки были удалены"""
+        with self.transaction() as cursor:
+            where = self._filter_pending(cursor, user_ids)
+            denied = [
+                row[0] for row in cursor.execute('DELETE FROM pending_users' + where + ' RETURNING user_id')
+            ]
+        return denied
+
+    def remove_pending_user(self, user_id: int) -> bool:
+        try:
+            return bool(self.deny_pending_users([user_id]))
+        except Exception as e:
+            logging.error(f"Ошибка удаления заявки {user_id}: {e}")
+            return False
+
     def add_task(self, user_id: int, task_name: str, description: str) -> int:
         try:
-            cursor = self.execute_query(
-                '''INSERT INTO tasks (user_id, task_name, description)
-                   VALUES (?, ?, ?)
-                   RETURNING task_id''',
-                (user_id, task_name, description)
-            )
-            task_id = cursor.fetchone()[0]
-            self.conn.commit()
+            # RETURNING нужно дочитать до commit, поэтому через transaction
+            with self.transaction() as cursor:
+                cursor.execute(
+                    '''INSERT INTO tasks (user_id, task_name, description)
+                       VALUES (?, ?, ?)
+                       RETURNING task_id''',
+                    (user_id, task_name, description)
+                )
+                task_id = cursor.fetchone()[0]
             return task_id
         except Exception as e:
             print(f"Ошибка добавления задания: {e}")
@@ -174,43 +751,292 @@ class Database:
             (user_id,)
         ).fetchall()
 
-    def start_timer(self, task_id: int, user_id: int):
-        self.execute_query(
-            '''INSERT INTO task_timers (task_id, user_id, start_time)
-               VALUES (?, ?, datetime('now'))''',
-            (task_id, user_id)
-        )
-        self.conn.commit()
-
-    def stop_timer(self, task_id: int, user_id: int):
-        self.execute_query(
-            '''UPDATE task_timers 
-               SET end_time = datetime('now'),
-                   duration = CAST(
-                       (JULIANDAY(datetime('now')) - JULIANDAY(start_time)) * 86400 
-                       AS INTEGER
-                   )
-               WHERE task_id = ? AND user_id = ? AND end_time IS NULL''',
-            (task_id, user_id)
-        )
-        self.conn.commit()
+    def get_task_page(self, user_id: int, offset: int, limit: int, own_only: bool = False) -> List[sqlite3.Row]:
+        """Страница заданий пользователя: сначала назначенные, затем личные,
+        внутри — от новых к старым. Колонка kind: 'assigned' или 'own'"""
+        own = '''SELECT 'own' AS kind, task_id, task_name, description,
+                        0 AS completed, total_duration, created_at
+                 FROM tasks WHERE user_id = ?'''
+        if own_only:
+            query, params = own, (user_id,)
+        else:
+            query = '''SELECT 'assigned' AS kind, task_id, task_name, description,
+                              completed, 0 AS total_duration, created_at
+                       FROM assigned_tasks WHERE assigned_to = ?
+                       UNION ALL ''' + own
+            params = (user_id, user_id)
+        return self.execute_query(
+            query + ' ORDER BY kind, created_at DESC LIMIT ? OFFSET ?',
+            params + (limit, offset)
+        ).fetchall()
+
+    def load_active_timers(self):
+        """Восстанавливает реестр запущенных таймеров из незакрытых записей"""
+        rows = self.execute_query(
+            'SELECT user_id, kind, task_id, start_time FROM task_timers WHERE end_time IS NULL'
+        ).fetchall()
+        self._active_timers = {
+            (user_id, kind, task_id): start_time for user_id, kind, task_id, start_time in rows
+        }
+
+    async def begin_timer(self, task_id: int, user_id: int, kind: str = 'own') -> bool:
+        """Запускает таймер задания kind ('own' или 'assigned'). Реестр обновляется сразу,
+        а если запись в БД не удалась — откатывается и исключение пробрасывается.
+        Возвращает False, если таймер уже запущен"""
+        key = (user_id, kind, task_id)
+        if key in self._active_timers:
+            return False
+        started = self._active_timers[key] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            await self.write(self.START_TIMER_QUERY, (task_id, user_id, kind), wait=True)
+        except Exception:
+            if self._active_timers.get(key) == started:
+                del self._active_timers[key]
+            raise
+        return True
+
+    async def end_timer(self, task_id: int, user_id: int, kind: str = 'own') -> bool:
+        """Останавливает таймер задания kind. Реестр обновляется сразу, а если запись
+        в БД не удалась — восстанавливается и исключение пробрасывается.
+        Возвращает False, если запущенного таймера нет"""
+        key = (user_id, kind, task_id)
+        started = self._active_timers.pop(key, None)
+        if started is None:
+            return False
+        try:
+            await self.write(self.STOP_TIMER_QUERY, (task_id, user_id, kind), wait=True)
+        except Exception:
+            self._active_timers.setdefault(key, started)
+            raise
+        return True
 
     def assign_task(self, admin_id: int, user_id: int, task_name: str, description: str) -> int:
         try:
-            cursor = self.execute_query(
-                '''INSERT INTO assigned_tasks 
-                   (assigned_by, assigned_to, task_name, description)
-                   VALUES (?, ?, ?, ?)
-                   RETURNING task_id''',
-                (admin_id, user_id, task_name, description)
-            )
-            task_id = cursor.fetchone()[0]
-            self.conn.commit()
+            with self.transaction() as cursor:
+                cursor.execute(
+                    '''INSERT INTO assigned_tasks 
+                       (assigned_by, assigned_to, task_name, description)
+                       VALUES (?, ?, ?, ?)
+                       RETURNING task_id''',
+                    (admin_id, user_id, task_name, description)
+                )
+                task_id = cursor.fetchone()[0]
             return task_id
         except Exception as e:
             print(f"Ошибка назначения задания: {e}")
             return None
 
+    def get_daily_stats(self, days: int = 7) -> Tuple[List[sqlite3.Row], List[sqlite3.Row]]:
+        """Статистика за последние days дней только по сводкам daily_stats.
+
+        Возвращает (итоги по дням, самые активные пользователи за период).
+        """
+        since = f'-{days - 1} days'
+        by_day = self.execute_query(
+            '''SELECT day, SUM(practice_seconds) AS practice_seconds,
+                      SUM(tasks_completed) AS tasks_completed,
+                      SUM(access_grants) AS access_grants,
+                      COUNT(CASE WHEN practice_seconds > 0 THEN 1 END) AS active_users
+               FROM daily_stats
+               WHERE day >= date('now', ?)
+               GROUP BY day
+               ORDER BY day DESC''',
+            (since,)
+        ).fetchall()
+        top_users = self.execute_query(
+            '''SELECT d.user_id, a.username, a.full_name,
+                      SUM(d.practice_seconds) AS practice_seconds,
+                      SUM(d.tasks_completed) AS tasks_completed
+               FROM daily_stats d
+               LEFT JOIN allowed_users a ON a.user_id = d.user_id
+               WHERE d.day >= date('now', ?)
+               GROUP BY d.user_id
+               HAVING SUM(d.practice_seconds) > 0 OR SUM(d.tasks_completed) > 0
+               ORDER BY practice_seconds DESC
+               LIMIT 5''',
+            (since,)
+        ).fetchall()
+        return by_day, top_users
+
+    # Обслуживание базы (см. utils/maintenance.py). Каждый метод делает
+    # одну короткую транзакцию не больше limit строк/страниц
+
+    def close_orphan_timers(self, max_age_hours: int, limit: int) -> int:
+        """Закрывает таймеры, забытые запущенными дольше max_age_hours.
+        Время такого таймера не засчитывается (duration = 0)"""
+        with self.transaction() as cursor:
+            rows = cursor.execute(
+                '''SELECT timer_id, user_id, kind, task_id FROM task_timers
+                   WHERE end_time IS NULL AND start_time < datetime('now', ?)
+                   LIMIT ?''',
+                (f'-{max_age_hours} hours', limit)
+            ).fetchall()
+            cursor.executemany(
+                '''UPDATE task_timers SET end_time = datetime('now'), duration = 0
+                   WHERE timer_id = ?''',
+                [(row[0],) for row in rows]
+            )
+        for _, user_id, kind, task_id in rows:
+            self._active_timers.pop((user_id, kind, task_id), None)
+        return len(rows)
+
+    def purge_stale_pending_users(self, max_age_days: int, limit: int) -> int:
+        """Удаляет заявки на доступ старше max_age_days"""
+        with self.transaction() as cursor:
+            cursor.execute(
+                '''DELETE FROM pending_users WHERE user_id IN (
+                       SELECT user_id FROM pending_users
+                       WHERE request_time < datetime('now', ?)
+                       LIMIT ?
+                   )''',
+                (f'-{max_age_days} days', limit)
+            )
+            return cursor.rowcount
+
+    # Строк на индекс при ANALYZE (рекомендация SQLite — от 100 до 1000)
+    ANALYSIS_LIMIT = 400
+
+    def optimize(self) -> bool:
+        """Обновляет статистику планировщика. ANALYZE — только при первом запуске,
+        дальше PRAGMA optimize пересчитывает то, что устарело. Возвращает True при ANALYZE.
+        analysis_limit ограничивает просмотр каждого индекса, чтобы на большой базе
+        не держать блокировку записи на всё время полного сканирования"""
+        self.execute_query(f'PRAGMA analysis_limit = {self.ANALYSIS_LIMIT}').fetchall()
+        has_stats = self.execute_query(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone()
+        if has_stats:
+            self.execute_query('PRAGMA optimize').fetchall()
+            return False
+        self.execute_query('ANALYZE').fetchall()
+        return True
+
+    def incremental_vacuum(self, pages: int) -> Optional[int]:
+        """Возвращает в ОС до pages свободных страниц.
+        None — если база создана без auto_vacuum=INCREMENTAL"""
+        if self.execute_query('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return None
+        free_before = self.execute_query('PRAGMA freelist_count').fetchone()[0]
+        # executescript шагает прагму до конца; execute освободил бы одну страницу
+        self.conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+        return free_before - self.execute_query('PRAGMA freelist_count').fetchone()[0]
+
+    def get_cached_videos(self, category: str) -> Tuple[List[Dict], Optional[float], Optional[str]]:
+        """Видео категории из каталога, время их загрузки (None — каталог пуст)
+        и токен следующей страницы YouTube"""
+        rows = self.execute_query(
+            '''SELECT c.video_id, c.title, c.thumbnail, c.fetched_at, c.next_page_token,
+                      m.duration, m.view_count, m.channel_title
+               FROM video_cache c
+               LEFT JOIN video_metadata m ON m.video_id = c.video_id
+               WHERE c.category = ? ORDER BY c.position''',
+            (category,)
+        ).fetchall()
+        if not rows:
+            return [], None, None
+        videos = [
+            {
+                'title': row['title'],
+                'video_id': row['video_id'],
+                'thumbnail': row['thumbnail'],
+                'url': f"https://www.youtube.com/watch?v={row['video_id']}",
+                'duration': row['duration'],
+                'views': row['view_count'],
+                'channel': row['channel_title'],
+            }
+            for row in rows
+        ]
+        return videos, rows[0]['fetched_at'], rows[0]['next_page_token']
+
+    def replace_cached_videos(self, category: str, videos: List[Dict], fetched_at: float,
+                              next_page_token: str = None):
+        """Заменяет видео категории в каталоге одной транзакцией"""
+        with self.transaction() as cursor:
+            cursor.execute('DELETE FROM video_cache WHERE category = ?', (category,))
+            cursor.executemany(
+                '''INSERT INTO video_cache
+                   (category, position, video_id, title, thumbnail, fetched_at, next_page_token)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                [
+                    (category, position, video['video_id'], video['title'], video['thumbnail'],
+                     fetched_at, next_page_token)
+                    for position, video in enumerate(videos)
+                ]
+            )
+
+    def get_video_metadata(self, video_ids: List[str], max_age: float) -> Dict[str, sqlite3.Row]:
+        """Метаданные видео не старше max_age секунд: video_id -> строка"""
+        if not video_ids:
+            return {}
+        placeholders = ','.join('?' * len(video_ids))
+        rows = self.execute_query(
+            f'''SELECT video_id, duration, view_count, channel_title FROM video_metadata
+                WHERE video_id IN ({placeholders}) AND fetched_at > ?''',
+            tuple(video_ids) + (time.time() - max_age,)
+        ).fetchall()
+        return {row['video_id']: row for row in rows}
+
+    def save_video_metadata(self, metadata: Dict[str, Dict]):
+        """Сохраняет метаданные видео одной транзакцией"""
+        fetched_at = time.time()
+        with self.transaction() as cursor:
+            cursor.executemany(
+                '''INSERT OR REPLACE INTO video_metadata
+                   (video_id, duration, view_count, channel_title, fetched_at)
+                   VALUES (?, ?, ?, ?, ?)''',
+                [
+                    (video_id, item['duration'], item['views'], item['channel'], fetched_at)
+                    for video_id, item in metadata.items()
+                ]
+            )
+
+    EXERCISE_COLUMNS = 'exercise_id, category, title, description, video_url, video_file_id'
+
+    def add_exercise(self, category: str, title: str, description: str, video_url: str = None,
+                     video_file_id: str = None, created_by: int = None) -> int:
+        with self.transaction() as cursor:
+            cursor.execute(
+                '''INSERT INTO exercises (category, title, description, video_url, video_file_id, created_by)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (category, title, description, video_url, video_file_id, created_by)
+            )
+            return cursor.lastrowid
+
+    def delete_exercise(self, exercise_id: int) -> bool:
+        return self.execute_query(
+            'DELETE FROM exercises WHERE exercise_id = ?', (exercise_id,)
+        ).rowcount > 0
+
+    def get_exercise(self, exercise_id: int) -> Optional[sqlite3.Row]:
+        return self.execute_query(
+            f'SELECT {self.EXERCISE_COLUMNS} FROM exercises WHERE exercise_id = ?',
+            (exercise_id,)
+        ).fetchone()
+
+    def get_category_exercises(self, category: str, limit: int = 10) -> List[sqlite3.Row]:
+        return self.execute_query(
+            f'''SELECT {self.EXERCISE_COLUMNS} FROM exercises
+                WHERE category = ? ORDER BY exercise_id LIMIT ?''',
+            (category, limit)
+        ).fetchall()
+
+    def search_exercises(self, text: str, limit: int = 10) -> List[sqlite3.Row]:
+        """Полнотекстовый поиск по названию и описанию (по началам слов, лучшие — первыми)"""
+        # Каждое слово — отдельная фраза-префикс: спецсимволы FTS5 из ввода не интерпретируются
+        words = [word.replace('"', '""') for word in text.split()]
+        if not words:
+            return []
+        match = ' '.join(f'"{word}"*' for word in words)
+        return self.execute_query(
+            f'''SELECT {', '.join('e.' + column for column in self.EXERCISE_COLUMNS.split(', '))}
+                FROM exercises_fts
+                JOIN exercises e ON e.exercise_id = exercises_fts.rowid
+                WHERE exercises_fts MATCH ?
+                ORDER BY bm25(exercises_fts, 10.0, 1.0)
+                LIMIT ?''',
+            (match, limit)
+        ).fetchall()
+
     def get_assigned_tasks(self, user_id: int):
         return self.execute_query(
             '''SELECT task_id, task_name, description, created_at, completed
@@ -222,17 +1048,8 @@ class Database:
 
     def complete_assigned_task(self, task_id: int, user_id: int) -> bool:
         try:
-            self.execute_query(
-                '''UPDATE assigned_tasks 
-                   SET completed = 1
-                   WHERE task_id = ? AND assigned_to = ?''',
-                (task_id, user_id)
-            )
-            self.conn.commit()
+            self.execute_query(self.COMPLETE_ASSIGNED_TASK_QUERY, (task_id, user_id))
             return True
         except Exception as e:
             print(f"Ошибка завершения задания: {e}")
             return False
-
-# Создаем единственный экземпляр базы данных
-db = Database() 
\ No newline at end of file
@@ -1,12 +1,13 @@
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from config import ADMIN_IDS, CHANNEL_ID, CHANNEL_URL, ADMIN_USERNAME, EXERCISE_CATEGORIES
-from database import db
+from config import ADMIN_IDS, CHANNEL_URL, ADMIN_USERNAME, EXERCISE_CATEGORIES
+from database import Database
+from utils.membership import membership_cache
 import logging
 
 router = Router()
 
-async def access_middleware(message: Message, bot: Bot) -> bool:
+async def access_middleware(message: Message, bot: Bot, db: Database) -> bool:
     user_id = message.from_user.id
     
     # Проверяем доступ через базу данных (которая уже проверяет админов)
@@ -16,8 +17,7 @@ async def access_middleware(message: Message, bot: Bot) -> bool:
         
     # Для остальных проверяем подписку на канал
     try:
-        member = await bot.get_chat_member(CHANNEL_ID, user_id)
-        is_subscribed = member.status not in ['left', 'kicked', 'banned']
+        is_subscribed = await membership_cache.is_subscribed(bot, user_id)
         
         if not is_subscribed:
             # Показываем кнопку подписки
@@ -47,10 +47,10 @@ async def access_middleware(message: Message, bot: Bot) -> bool:
             return False
             
         # Проверяем ожидание подтверждения
-        pending = db.execute_query(
+        pending = await db.fetchone(
             'SELECT 1 FROM pending_users WHERE user_id = ?', 
             (user_id,)
-        ).fetchone()
+        )
         
         if pending:
             await message.answer(
@@ -84,12 +84,13 @@ async def access_middleware(message: Message, bot: Bot) -> bool:
         return False
 
 @router.callback_query(lambda c: c.data == "check_subscription")
-async def check_subscription(callback: CallbackQuery):
+async def check_subscription(callback: CallbackQuery, db: Database):
     user_id = callback.from_user.id
     
     try:
-        member = await callback.bot.get_chat_member(CHANNEL_ID, user_id)
-        is_subscribed = member.status not in ['left', 'kicked', 'banned']
+        # Пользователь явно просит перепроверить — идём в Telegram мимо кэша
+        membership_cache.bust(user_id)
+        is_subscribed = await membership_cache.is_subscribed(callback.bot, user_id)
         
         if is_subscribed:
             # Если подписан - проверяем доступ
@@ -129,13 +130,12 @@ async def check_subscription(callback: CallbackQuery):
         )
 
 @router.message(lambda m: m.text == "🎯 Мои упражнения")
-async def show_exercises(message: Message):
+async def show_exercises(message: Message, db: Database):
     user_id = message.from_user.id
     
     # Проверяем подписку на канал
     try:
-        member = await message.bot.get_chat_member(CHANNEL_ID, user_id)
-        is_subscribed = member.status not in ['left', 'kicked', 'banned']
+        is_subscribed = await membership_cache.is_subscribed(message.bot, user_id)
         
         if not is_subscribed:
             # Если не подписан на канал
@@ -167,10 +167,10 @@ async def show_exercises(message: Message):
         # Проверяем наличие доступа
         if not db.is_user_allowed(user_id):
             # Проверяем, не отправлял ли уже запрос
-            pending = db.execute_query(
+            pending = await db.fetchone(
                 'SELECT 1 FROM pending_users WHERE user_id = ?', 
                 (user_id,)
-            ).fetchone()
+            )
             
             if pending:
                 await message.answer(
@@ -214,6 +214,12 @@ async def show_exercises_menu(message: Message):
                 callback_data=f"ex_{code}"
             )
         ])
+    keyboard.append([
+        InlineKeyboardButton(
+            text="🔍 Поиск по упражнениям",
+            callback_data="search_exercises"
+        )
+    ])
     
     markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
     await message.answer(
@@ -227,17 +233,17 @@ async def show_exercises_menu(message: Message):
     ) 
 
 @router.callback_query(lambda c: c.data == "request_access")
-async def process_access_request(callback: CallbackQuery):
+async def process_access_request(callback: CallbackQuery, db: Database):
     user_id = callback.from_user.id
     username = callback.from_user.username
     full_name = callback.from_user.full_name
     
     try:
         # Проверяем, не отправлял ли уже запрос
-        pending = db.execute_query(
+        pending = await db.fetchone(
             'SELECT 1 FROM pending_users WHERE user_id = ?', 
             (user_id,)
-        ).fetchone()
+        )
         
         if pending:
             await callback.answer(
@@ -247,11 +253,11 @@ async def process_access_request(callback: CallbackQuery):
             return
             
         # Добавляем пользователя в список ожидающих
-        db.execute_query(
+        await db.write(
             'INSERT INTO pending_users (user_id, username, full_name) VALUES (?, ?, ?)',
-            (user_id, username, full_name)
+            (user_id, username, full_name),
+            wait=True
         )
-        db.conn.commit()
         
         await callback.answer(
             "✅ Заявка отправлена! Ожидайте решения администратора.",
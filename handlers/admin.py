@@ -3,15 +3,24 @@ import os
 import asyncio
 from aiogram import Router, F, types, Bot
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, FSInputFile
 from config import ADMIN_IDS
 from keyboards.admin_kb import get_admin_keyboard
 from keyboards.client_kb import get_main_keyboard
-from database import db
+from database import Database
+from utils.membership import membership_cache
+from utils.export import EXPORT_TABLES, EXPORT_FORMATS, export_table
+from utils.maintenance import Maintenance
+from utils.quota import QuotaManager
+from utils.youtube import search_flights
 import json
 from datetime import datetime
 from aiogram.fsm.context import FSMContext
 from states.admin_states import AdminStates
+from states.exercise_states import AddExerciseStates
+from config import EXERCISE_CATEGORIES
+from handlers.exercises import EXERCISE_DESCRIPTION_LIMIT
+from utils.text import utf16_len
 from aiogram.methods import GetChat
 from aiogram.fsm.state import StatesGroup, State
 
@@ -45,32 +54,10 @@ def get_restart_status() -> dict:
     except Exception as e:
         print(f"Ошибка при чтении статуса: {e}")
         return None
-# Добавляем в базу данных таблицу для ожидающих доступ
-async def init_db():
-    # Создаем таблицу для ожидающих доступ
-    db.execute_query('''
-    CREATE TABLE IF NOT EXISTS pending_users (
-        user_id INTEGER PRIMARY KEY,
-        username TEXT,
-        full_name TEXT,
-        request_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Создаем таблицу для пользователей с доступом
-    db.execute_query('''
-    CREATE TABLE IF NOT EXISTS allowed_users (
-        user_id INTEGER PRIMARY KEY,
-        username TEXT,
-        full_name TEXT,
-        granted_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-
 # Функция для добавления пользователя в список ожидающих
-async def add_pending_user(bot: Bot, user_id: int, username: str = None, full_name: str = None):
+async def add_pending_user(bot: Bot, db: Database, user_id: int, username: str = None, full_name: str = None):
     # Добавляем пользователя в список ожидающих
-    db.execute_query(
+    await db.write(
         'INSERT OR REPLACE INTO pending_users (user_id, username, full_name) VALUES (?, ?, ?)',
         (user_id, username, full_name)
     )
@@ -107,7 +94,7 @@ async def add_pending_user(bot: Bot, user_id: int, username: str = None, full_na
 
 # Добавляем обработчик для просмотра заявки
 @router.callback_query(lambda c: c.data.startswith('view_request_'))
-async def view_request(callback: CallbackQuery):
+async def view_request(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
     
@@ -115,10 +102,10 @@ async def view_request(callback: CallbackQuery):
         user_id = int(callback.data.split('_')[2])
         
         # Получаем информацию о пользователе
-        user = db.execute_query(
+        user = await db.fetchone(
             'SELECT user_id, username, full_name, request_time FROM pending_users WHERE user_id = ?',
             (user_id,)
-        ).fetchone()
+        )
         
         if not user:
             await callback.answer("❌ Заявка не найдена", show_alert=True)
@@ -200,8 +187,180 @@ async def check_status(message: Message):
     else:
         status_text = "❌ Информация о статусе недоступна"
     
+    cache_stats = membership_cache.stats()
+    status_text += (
+        f"\n▫️ Кэш подписок: {cache_stats['size']} записей, "
+        f"попаданий {cache_stats['hits']}, промахов {cache_stats['misses']} "
+        f"({cache_stats['hit_rate']:.0%})\n"
+    )
+    
     await message.answer(status_text, reply_markup=get_admin_keyboard())
 
+def format_seconds(seconds: int) -> str:
+    hours, rest = divmod(seconds or 0, 3600)
+    return f"{hours}ч {rest // 60}мин"
+
+# Статистика занятий: читает только дневные сводки daily_stats
+@router.message(lambda m: m.text == "📊 Статистика" and m.from_user.id in ADMIN_IDS)
+async def show_statistics(message: Message, db: Database):
+    if not is_admin(message.from_user.id):
+        return
+
+    try:
+        by_day, top_users = await db.call(db.get_daily_stats, 7)
+
+        if not by_day:
+            await message.answer("📊 За последние 7 дней активности нет", reply_markup=get_admin_keyboard())
+            return
+
+        text = "📊 Статистика за 7 дней:\n\n"
+        for row in by_day:
+            text += (
+                f"▫️ {row['day']}: {format_seconds(row['practice_seconds'])} занятий, "
+                f"активных {row['active_users']}, "
+                f"заданий выполнено {row['tasks_completed']}, "
+                f"доступов выдано {row['access_grants']}\n"
+            )
+
+        text += (
+            f"\nИтого: {format_seconds(sum(row['practice_seconds'] for row in by_day))} занятий, "
+            f"заданий {sum(row['tasks_completed'] for row in by_day)}, "
+            f"доступов {sum(row['access_grants'] for row in by_day)}\n"
+        )
+
+        if top_users:
+            text += "\n🏆 Самые активные:\n"
+            for i, user in enumerate(top_users, 1):
+                name = f"@{user['username']}" if user['username'] else (user['full_name'] or user['user_id'])
+                text += (
+                    f"{i}. {name}: {format_seconds(user['practice_seconds'])}, "
+                    f"заданий {user['tasks_completed']}\n"
+                )
+
+        await message.answer(text, reply_markup=get_admin_keyboard())
+
+    except Exception as e:
+        print(f"Ошибка при получении статистики: {e}")
+        await message.answer("❌ Произошла ошибка при получении статистики")
+
+# Статистика запросов к базе данных
+@router.message(Command("db_stats"))
+async def db_stats(message: Message, db: Database):
+    if not is_admin(message.from_user.id):
+        return
+    
+    args = message.text.split()
+    if len(args) > 1 and args[1] == "reset":
+        db.query_stats.reset()
+        await message.answer("✅ Статистика запросов сброшена")
+        return
+    
+    top = db.query_stats.top(10)
+    if not top:
+        await message.answer("📊 Статистика запросов пока пуста")
+        return
+    
+    text = "📊 Самые затратные запросы (по суммарному времени):\n\n"
+    for i, stat in enumerate(top, 1):
+        sql = stat['sql'] if len(stat['sql']) <= 120 else stat['sql'][:117] + "..."
+        text += (
+            f"{i}. {sql}\n"
+            f"   ×{stat['count']} | всего {stat['total_ms']:.1f} мс | "
+            f"p50 {stat['p50_ms']:.2f} | p95 {stat['p95_ms']:.2f} | "
+            f"max {stat['max_ms']:.2f} мс\n\n"
+        )
+    text += "Сбросить: /db_stats reset"
+    
+    await message.answer(text)
+
+# Отчёт фонового обслуживания базы; /maintenance run — запустить сейчас
+@router.message(Command("maintenance"))
+async def maintenance_report(message: Message, maintenance: Maintenance):
+    if not is_admin(message.from_user.id):
+        return
+    
+    try:
+        if message.text.split()[1:2] == ["run"]:
+            await message.answer("🔧 Запускаю обслуживание базы...")
+            report = await maintenance.run_once()
+        else:
+            report = maintenance.last_report
+        
+        if not report:
+            await message.answer("🔧 Обслуживание ещё не запускалось\n\nЗапустить: /maintenance run")
+            return
+        
+        vacuumed = report['vacuumed_pages']
+        analyzed = report['analyzed']
+        if isinstance(analyzed, str):
+            analyzed_text = analyzed  # текст ошибки из отчёта
+        else:
+            analyzed_text = 'ANALYZE' if analyzed else 'PRAGMA optimize'
+        await message.answer(
+            "🔧 Обслуживание базы\n\n"
+            f"▫️ Запуск: {report['started_at']} ({report['elapsed_ms']:.0f} мс)\n"
+            f"▫️ Закрыто забытых таймеров: {report['orphan_timers']}\n"
+            f"▫️ Удалено старых заявок: {report['stale_pending']}\n"
+            f"▫️ Статистика планировщика: {analyzed_text}\n"
+            f"▫️ Освобождено страниц: {'auto_vacuum выключен' if vacuumed is None else vacuumed}"
+        )
+    except Exception as e:
+        print(f"Ошибка при обслуживании базы: {e}")
+        await message.answer("❌ Произошла ошибка при обслуживании базы")
+
+# Расход квоты YouTube Data API за текущие сутки
+@router.message(Command("quota"))
+async def quota_report(message: Message, quota: QuotaManager):
+    if not is_admin(message.from_user.id):
+        return
+    
+    stats = quota.stats()
+    hours, rest = divmod(int(stats['reset_in'].total_seconds()), 3600)
+    await message.answer(
+        f"📈 Квота YouTube API за {stats['day']} (время США, тихоокеанское)\n\n"
+        f"▫️ Израсходовано: {stats['units']} из {stats['limit']} единиц\n"
+        f"▫️ Осталось: {stats['remaining']} (резерв {stats['reserve']} — только для пустых категорий)\n"
+        f"▫️ Запросов к API: {stats['calls']}\n"
+        f"▫️ Отказов по квоте: {stats['rejected']}, по частоте: {stats['throttled']}\n"
+        f"▫️ Доступно запросов подряд: {stats['tokens']:.1f}\n"
+        f"▫️ Поисков объединено с уже идущими: {search_flights.shared} (выполнено {search_flights.calls})\n"
+        f"▫️ Сброс через: {hours}ч {rest // 60}мин"
+    )
+
+# Выгрузка таблицы файлом: /export tasks jsonl gz
+@router.message(Command("export"))
+async def export_data(message: Message, db: Database):
+    if not is_admin(message.from_user.id):
+        return
+    
+    args = message.text.split()[1:]
+    if not args or args[0] not in EXPORT_TABLES:
+        await message.answer(
+            "❌ Использование: /export TABLE [csv|jsonl] [gz]\n\n"
+            f"Таблицы: {', '.join(EXPORT_TABLES)}"
+        )
+        return
+    
+    table = args[0]
+    fmt = next((arg for arg in args[1:] if arg in EXPORT_FORMATS), 'csv')
+    compress = 'gz' in args[1:]
+    
+    path = None
+    try:
+        # Чтение идёт в отдельном потоке и соединении, бот в это время работает
+        await db.flush()
+        path = await asyncio.to_thread(export_table, db.db_path, table, fmt, compress)
+        await message.answer_document(
+            FSInputFile(path, filename=os.path.basename(path)),
+            caption=f"📦 Выгрузка {table} ({fmt}{', gzip' if compress else ''})"
+        )
+    except Exception as e:
+        print(f"Ошибка при выгрузке {table}: {e}")
+        await message.answer("❌ Произошла ошибка при выгрузке")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
 # Обработчик для кнопки "Назад"
 @router.message(F.text == "↩️ Назад")
 async def back_to_main(message: Message):
@@ -226,8 +385,8 @@ async def unauthorized_admin_access(message: Message):
     )
 
 # Добавляем команду для выдачи доступа
-@router.message(lambda m: m.text.startswith('/grant_access'))
-async def grant_access(message: Message):
+@router.message(lambda m: m.text and m.text.startswith('/grant_access'))
+async def grant_access(message: Message, db: Database):
     if not is_admin(message.from_user.id):
         return
     
@@ -236,7 +395,7 @@ async def grant_access(message: Message):
         user_id = int(message.text.split()[1])
         
         # Добавляем пользователя в базу данных
-        if db.add_allowed_user(user_id, message.from_user.id):
+        if await db.call(db.add_allowed_user, user_id, message.from_user.id):
             await message.answer(f"✅ Доступ выдан пользователю {user_id}")
         else:
             await message.answer("❌ Ошибка при выдаче доступа")
@@ -248,8 +407,8 @@ async def grant_access(message: Message):
         )
 
 # Добавляем команду для отзыва доступа
-@router.message(lambda m: m.text.startswith('/revoke_access'))
-async def revoke_access(message: Message):
+@router.message(lambda m: m.text and m.text.startswith('/revoke_access'))
+async def revoke_access(message: Message, db: Database):
     if not is_admin(message.from_user.id):
         return
     
@@ -258,7 +417,7 @@ async def revoke_access(message: Message):
         user_id = int(message.text.split()[1])
         
         # Удаляем пользователя из базы данных
-        if db.remove_allowed_user(user_id):
+        if await db.call(db.remove_allowed_user, user_id):
             await message.answer(f"✅ Доступ отозван у пользователя {user_id}")
         else:
             await message.answer("❌ Ошибка при отзыве доступа")
@@ -271,15 +430,15 @@ async def revoke_access(message: Message):
 
 # Добавляем команду для просмотра списка пользователей с доступом
 @router.message(lambda m: m.text == '/list_access')
-async def list_access(message: Message):
+async def list_access(message: Message, db: Database):
     if not is_admin(message.from_user.id):
         return
-    
-    allowed_users = db.execute_query('''
-        SELECT user_id, username, full_name
-        FROM allowed_users 
-        WHERE user_id NOT IN ({})
-    '''.format(','.join(map(str, ADMIN_IDS)))).fetchall()
+    await render_access_list(message, db)
+
+async def render_access_list(message: Message, db: Database, after: int = None, before: int = None, edit: bool = False):
+    allowed_users, has_prev, has_next = await db.call(
+        db.get_users_page, 'allowed_users', after=after, before=before, exclude=ADMIN_IDS
+    )
 
     if not allowed_users:
         await message.answer("📊 Список пользователей с доступом пуст")
@@ -300,6 +459,7 @@ async def list_access(message: Message):
             )
         ])
     
+    add_page_buttons(keyboard, "access", allowed_users, has_prev, has_next)
     keyboard.append([
         InlineKeyboardButton(
             text="🔄 Обновить список",
@@ -308,14 +468,14 @@ async def list_access(message: Message):
     ])
     
     markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-    await message.answer(text, reply_markup=markup)
+    await send_page(message, text, markup, edit)
 
 # Добавляем обработчик обновления списка
 @router.callback_query(lambda c: c.data == "refresh_list")
-async def refresh_list(callback: CallbackQuery):
+async def refresh_list(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
-    await list_access(callback.message)
+    await render_access_list(callback.message, db)
     await callback.answer("Список обновлен")
 
 # Добавляем справку по командам доступа
@@ -329,6 +489,12 @@ async def access_help(message: Message):
         "/grant_access USER_ID - выдать доступ\n"
         "/revoke_access USER_ID - отозвать доступ\n"
         "/list_access - список пользователей с доступом\n"
+        "/db_stats - статистика запросов к базе данных\n"
+        "/export TABLE [csv|jsonl] [gz] - выгрузка таблицы файлом\n"
+        "/maintenance [run] - отчёт (или запуск) обслуживания базы\n"
+        "/quota - расход квоты YouTube API\n"
+        "/add_exercise - добавить упражнение в библиотеку\n"
+        "/del_exercise ID - удалить упражнение из библиотеки\n"
         "/access_help - эта справка"
     )
     
@@ -336,14 +502,16 @@ async def access_help(message: Message):
 
 # Обработчик кнопки "Ожидают доступ" в админ-панели
 @router.message(lambda m: m.text == "👥 Ожидают доступ")
-async def show_pending_users(message: Message):
+async def show_pending_users(message: Message, db: Database):
     if not is_admin(message.from_user.id):
         return
-        
-    # Получаем список ожидающих
-    pending_users = db.execute_query(
-        'SELECT user_id, username, full_name, request_time FROM pending_users'
-    ).fetchall()
+    await render_pending_users(message, db)
+
+async def render_pending_users(message: Message, db: Database, after: int = None, before: int = None, edit: bool = False):
+    # Получаем одну страницу ожидающих
+    pending_users, has_prev, has_next = await db.call(
+        db.get_users_page, 'pending_users', after=after, before=before
+    )
     
     text = "📊 Ожидают доступа:\n\n"
     keyboard = []
@@ -364,6 +532,7 @@ async def show_pending_users(message: Message):
     else:
         text = "👥 Нет ожидающих доступа"
     
+    add_page_buttons(keyboard, "pending", pending_users, has_prev, has_next)
     keyboard.append([
         InlineKeyboardButton(
             text="🔄 Обновить список",
@@ -372,19 +541,19 @@ async def show_pending_users(message: Message):
     ])
     
     markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-    await message.answer(text, reply_markup=markup)
+    await send_page(message, text, markup, edit)
 
 @router.message(lambda m: m.text == "✅ Пользователи с доступом" and m.from_user.id in ADMIN_IDS)
-async def show_allowed_users(message: Message):
+async def show_allowed_users(message: Message, db: Database):
     if not is_admin(message.from_user.id):
         return
-        
-    # Получаем пользователей с доступом
-    allowed_users = db.execute_query('''
-        SELECT user_id, username, full_name
-        FROM allowed_users 
-        WHERE user_id NOT IN ({})
-    '''.format(','.join(map(str, ADMIN_IDS)))).fetchall()
+    await render_allowed_users(message, db)
+
+async def render_allowed_users(message: Message, db: Database, after: int = None, before: int = None, edit: bool = False):
+    # Получаем одну страницу пользователей с доступом
+    allowed_users, has_prev, has_next = await db.call(
+        db.get_users_page, 'allowed_users', after=after, before=before, exclude=ADMIN_IDS
+    )
     
     if not allowed_users:
         text = "📊 Список пользователей с доступом пуст"
@@ -411,6 +580,7 @@ async def show_allowed_users(message: Message):
             )
         ])
     
+    add_page_buttons(keyboard, "allowed", allowed_users, has_prev, has_next)
     keyboard.append([
         InlineKeyboardButton(
             text="🔄 Обновить список",
@@ -419,11 +589,54 @@ async def show_allowed_users(message: Message):
     ])
     
     markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-    await message.answer(text, reply_markup=markup)
+    await send_page(message, text, markup, edit)
+
+# Списки пользователей листаются страницами: в callback_data лежит
+# user_id крайней строки, следующая страница выбирается по ключу (keyset)
+def add_page_buttons(keyboard: list, view: str, rows: list, has_prev: bool, has_next: bool):
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(
+            text="◀️ Назад",
+            callback_data=f"upage:{view}:b:{rows[0]['user_id']}"
+        ))
+    if has_next:
+        buttons.append(InlineKeyboardButton(
+            text="Вперёд ▶️",
+            callback_data=f"upage:{view}:a:{rows[-1]['user_id']}"
+        ))
+    if buttons:
+        keyboard.append(buttons)
+
+async def send_page(message: Message, text: str, markup: InlineKeyboardMarkup, edit: bool):
+    if edit:
+        await message.edit_text(text, reply_markup=markup)
+    else:
+        await message.answer(text, reply_markup=markup)
+
+@router.callback_query(lambda c: c.data.startswith("upage:"))
+async def paginate_users(callback: CallbackQuery, db: Database):
+    if not is_admin(callback.from_user.id):
+        return
+    
+    try:
+        _, view, direction, user_id = callback.data.split(':')
+        cursor = {'after': int(user_id)} if direction == 'a' else {'before': int(user_id)}
+        render = {
+            'access': render_access_list,
+            'pending': render_pending_users,
+            'allowed': render_allowed_users,
+            'users': render_users_menu,
+        }[view]
+        await render(callback.message, db, edit=True, **cursor)
+        await callback.answer()
+    except Exception as e:
+        print(f"Ошибка при переключении страницы: {e}")
+        await callback.answer("❌ Произошла ошибка", show_alert=True)
 
 # Обработчики callback-кнопок
 @router.callback_query(lambda c: c.data.startswith(("grant_", "deny_")))
-async def process_access_action(callback: CallbackQuery):
+async def process_access_action(callback: CallbackQuery, db: Database):
     try:
         action, user_id = callback.data.split('_')
         user_id = int(user_id)
@@ -432,27 +645,21 @@ async def process_access_action(callback: CallbackQuery):
         
         if action == "grant":
             # Получаем информацию о пользователе из pending_users
-            user_info = db.execute_query(
+            user_info = await db.fetchone(
                 'SELECT username, full_name FROM pending_users WHERE user_id = ?',
                 (user_id,)
-            ).fetchone()
+            )
             
             if user_info:
                 username, full_name = user_info
                 # Добавляем пользователя в список разрешенных с сохранением username
-                db.execute_query(
-                    'INSERT OR REPLACE INTO allowed_users (user_id, username, full_name) VALUES (?, ?, ?)',
-                    (user_id, username, full_name)
-                )
+                await db.call(db.add_allowed_user, user_id, username, full_name)
             else:
                 # Если нет в pending_users, получаем через API
                 chat_member = await bot.get_chat_member(user_id, user_id)
                 username = chat_member.user.username
                 full_name = chat_member.user.full_name
-                db.execute_query(
-                    'INSERT OR REPLACE INTO allowed_users (user_id, username, full_name) VALUES (?, ?, ?)',
-                    (user_id, username, full_name)
-                )
+                await db.call(db.add_allowed_user, user_id, username, full_name)
             
             try:
                 await bot.send_message(
@@ -460,7 +667,7 @@ async def process_access_action(callback: CallbackQuery):
                     "✅ Администратор одобрил ваш доступ к боту!\n"
                     "Теперь вы можете пользоваться всеми функциями."
                 )
-                db.execute_query('DELETE FROM pending_users WHERE user_id = ?', (user_id,))
+                await db.execute('DELETE FROM pending_users WHERE user_id = ?', (user_id,))
                 await callback.message.edit_text(f"✅ Доступ выдан пользователю {username or user_id}")
                 await callback.answer("✅ Доступ выдан", show_alert=True)
                 
@@ -476,7 +683,7 @@ async def process_access_action(callback: CallbackQuery):
                     "❌ К сожалению, ваш запрос на доступ отклонен."
                 )
                 # Удаляем из списка ожидающих
-                db.execute_query('DELETE FROM pending_users WHERE user_id = ?', (user_id,))
+                await db.execute('DELETE FROM pending_users WHERE user_id = ?', (user_id,))
                 # Обновляем сообщение
                 await callback.message.edit_text(f"❌ Запрос пользователя {user_id} отклонен")
                 await callback.answer("❌ Запрос отклонен", show_alert=True)
@@ -502,14 +709,16 @@ async def admin_command(message: Message):
 
 # Обработчик для кнопки "👥 Пользователи"
 @router.message(lambda m: m.text == "👥 Пользователи" and m.from_user.id in ADMIN_IDS)
-async def users_menu(message: types.Message):
+async def users_menu(message: types.Message, db: Database):
     if not is_admin(message.from_user.id):
         return
-        
-    # Получаем списки пользователей
-    pending_users = db.execute_query(
-        'SELECT user_id, username, full_name, request_time FROM pending_users'
-    ).fetchall()
+    await render_users_menu(message, db)
+
+async def render_users_menu(message: types.Message, db: Database, after: int = None, before: int = None, edit: bool = False):
+    # Получаем одну страницу ожидающих
+    pending_users, has_prev, has_next = await db.call(
+        db.get_users_page, 'pending_users', after=after, before=before
+    )
     
     text = "📊 Статистика пользователей:\n\n"
     keyboard = []
@@ -535,6 +744,7 @@ async def users_menu(message: types.Message):
     else:
         text += "👥 Нет ожидающих доступа\n"
     
+    add_page_buttons(keyboard, "users", pending_users, has_prev, has_next)
     keyboard.append([
         InlineKeyboardButton(
             text="🔄 Обновить список",
@@ -543,11 +753,11 @@ async def users_menu(message: types.Message):
     ])
     
     markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-    await message.answer(text, reply_markup=markup)
+    await send_page(message, text, markup, edit)
 
 # Добавляем обработчики для одобрения/отклонения отдельных пользователей
 @router.callback_query(lambda c: c.data.startswith('approve_user:'))
-async def approve_single_user(callback: CallbackQuery):
+async def approve_single_user(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
     
@@ -556,9 +766,9 @@ async def approve_single_user(callback: CallbackQuery):
         user_id = int(user_id)
         
         # Добавляем пользователя в список разрешенных
-        if db.add_allowed_user(user_id, callback.from_user.id):
+        if await db.call(db.add_allowed_user, user_id, callback.from_user.id):
             # Удаляем из списка ожидающих
-            db.remove_pending_user(user_id)
+            await db.call(db.remove_pending_user, user_id)
             
             try:
                 # Уведомляем пользователя
@@ -570,7 +780,7 @@ async def approve_single_user(callback: CallbackQuery):
                 print(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
             
             await callback.answer("✅ Пользователь одобрен")
-            await users_menu(callback.message)
+            await render_users_menu(callback.message, db)
         else:
             await callback.answer("❌ Ошибка при одобрении пользователя")
             
@@ -579,7 +789,7 @@ async def approve_single_user(callback: CallbackQuery):
         await callback.answer("❌ Произошла ошибка")
 
 @router.callback_query(lambda c: c.data.startswith('deny_user:'))
-async def deny_single_user(callback: CallbackQuery):
+async def deny_single_user(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
     
@@ -588,7 +798,7 @@ async def deny_single_user(callback: CallbackQuery):
         user_id = int(user_id)
         
         # Удаляем из списка ожидающих
-        if db.remove_pending_user(user_id):
+        if await db.call(db.remove_pending_user, user_id):
             try:
                 # Уведомляем пользователя
                 await callback.bot.send_message(
@@ -599,7 +809,7 @@ async def deny_single_user(callback: CallbackQuery):
                 print(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
             
             await callback.answer("✅ Пользователь отклонен")
-            await users_menu(callback.message)
+            await render_users_menu(callback.message, db)
         else:
             await callback.answer("❌ Ошибка при отклонении пользователя")
             
@@ -608,15 +818,15 @@ async def deny_single_user(callback: CallbackQuery):
         await callback.answer("❌ Произошла ошибка")
 
 @router.callback_query(lambda c: c.data == "refresh_users")
-async def refresh_users_list(callback: CallbackQuery):
+async def refresh_users_list(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
-    await list_access(callback.message)
+    await render_access_list(callback.message, db)
     await callback.answer("✅ Список обновлен")
 
 # Обработчик для одобрения/отклонения пользователей
 @router.callback_query(lambda c: c.data in ["approve_all", "deny_all"])
-async def process_users(callback: CallbackQuery):
+async def process_users(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
     
@@ -624,13 +834,11 @@ async def process_users(callback: CallbackQuery):
     bot = callback.bot
     
     if action == "approve_all":
-        # Получаем всех ожидающих пользователей
-        pending_users = db.execute_query('SELECT user_id FROM pending_users').fetchall()
+        # Одобряем всех ожидающих одной транзакцией
+        granted = await db.call(db.grant_pending_users)
         
-        # Одобряем каждого пользователя
-        for user in pending_users:
-            user_id = user[0]
-            db.add_allowed_user(user_id)
+        # Уведомляем одобренных пользователей
+        for user_id in granted:
             try:
                 await bot.send_message(
                     user_id,
@@ -640,19 +848,16 @@ async def process_users(callback: CallbackQuery):
             except Exception as e:
                 print(f"Ошибка отправки сообщения пользователю {user_id}: {e}")
         
-        # Очищаем список ожидающих
-        db.execute_query('DELETE FROM pending_users')
-        
         await callback.message.edit_text(
-            f"✅ Одобрено {len(pending_users)} пользователей"
+            f"✅ Одобрено {len(granted)} пользователей"
         )
     
     elif action == "deny_all":
         try:
-            # Получаем всех ожидающих пользователей
-            pending_users = db.execute_query('SELECT user_id FROM pending_users').fetchall()
+            # Отклоняем все заявки одной транзакцией
+            denied = await db.call(db.deny_pending_users)
             
-            for (user_id,) in pending_users:
+            for user_id in denied:
                 try:
                     await callback.bot.send_message(
                         user_id,
@@ -661,9 +866,6 @@ async def process_users(callback: CallbackQuery):
                 except Exception as e:
                     print(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
             
-            # Очищаем список ожидающих
-            db.execute_query('DELETE FROM pending_users')
-            
             await callback.message.edit_text("✅ Все запросы отклонены")
             await callback.answer("✅ Все запросы отклонены", show_alert=True)
             
@@ -673,7 +875,7 @@ async def process_users(callback: CallbackQuery):
 
 # Обработчик для выдачи доступа конкретному пользователю
 @router.message(Command("grant"))
-async def grant_access(message: Message):
+async def grant_access(message: Message, db: Database):
     if not is_admin(message.from_user.id):
         return
     
@@ -687,8 +889,8 @@ async def grant_access(message: Message):
     
     try:
         user_id = int(args[1])
-        db.add_allowed_user(user_id)
-        db.execute_query('DELETE FROM pending_users WHERE user_id = ?', (user_id,))
+        await db.call(db.add_allowed_user, user_id)
+        await db.execute('DELETE FROM pending_users WHERE user_id = ?', (user_id,))
         
         try:
             await message.bot.send_message(
@@ -706,7 +908,7 @@ async def grant_access(message: Message):
         await message.answer(f"❌ Ошибка: {e}") 
 
 @router.callback_query(lambda c: c.data.startswith('remove_user:'))
-async def remove_user_access(callback: CallbackQuery):
+async def remove_user_access(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав администратора")
         return
@@ -718,7 +920,7 @@ async def remove_user_access(callback: CallbackQuery):
         # Проверяем существование пользователя в базе
         if db.is_user_allowed(user_id):
             # Удаляем пользователя
-            if db.remove_allowed_user(user_id):
+            if await db.call(db.remove_allowed_user, user_id):
                 try:
                     # Уведомляем пользователя об удалении доступа
                     await callback.bot.send_message(
@@ -730,12 +932,12 @@ async def remove_user_access(callback: CallbackQuery):
                 
                 await callback.answer("✅ Пользователь успешно удален")
                 # Обновляем список пользователей
-                await users_menu(callback.message)
+                await render_users_menu(callback.message, db)
             else:
                 await callback.answer("❌ Ошибка при удалении из базы данных")
         else:
             await callback.answer("❌ Пользователь не найден в базе")
-            await users_menu(callback.message)
+            await render_users_menu(callback.message, db)
             
     except ValueError as e:
         print(f"Ошибка преобразования user_id: {e}")
@@ -750,7 +952,7 @@ async def add_user_start(callback: CallbackQuery):
     await callback.message.edit_reply_markup(reply_markup=None)
 
 @router.message(lambda m: m.text and m.text.startswith('@') and is_admin(m.from_user.id))
-async def add_user_finish(message: Message):
+async def add_user_finish(message: Message, db: Database):
     try:
         username = message.text[1:] if message.text.startswith('@') else message.text
         
@@ -760,11 +962,7 @@ async def add_user_finish(message: Message):
             user_id = result.id
             
             # Добавляем пользователя в список разрешенных
-            db.execute_query(
-                'INSERT OR REPLACE INTO allowed_users (user_id, username, full_name) VALUES (?, ?, ?)',
-                (user_id, username or "Нет username", "Нет имени")
-            )
-            db.conn.commit()
+            await db.call(db.add_allowed_user, user_id, username or "Нет username", "Нет имени")
             
             # Отправляем уведомление пользователю
             try:
@@ -803,15 +1001,15 @@ async def cancel_add_user(message: Message):
 
 # Добавляем обработчик для кнопки открытия панели пользователей
 @router.callback_query(lambda c: c.data == "open_users_panel")
-async def open_users_panel(callback: CallbackQuery):
+async def open_users_panel(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
     
-    await users_menu(callback.message)
+    await render_users_menu(callback.message, db)
     await callback.answer() 
 
 @router.callback_query(lambda c: c.data.startswith('grant_'))
-async def grant_access(callback: CallbackQuery):
+async def grant_access(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
     
@@ -824,7 +1022,7 @@ async def grant_access(callback: CallbackQuery):
         full_name = chat_member.user.full_name
         
         # Добавляем пользователя в список разрешенных с актуальным username
-        if db.add_allowed_user(user_id, username, full_name):
+        if await db.call(db.add_allowed_user, user_id, username, full_name):
             try:
                 # Отправляем уведомление пользователю
                 await callback.bot.send_message(
@@ -834,10 +1032,10 @@ async def grant_access(callback: CallbackQuery):
                 )
                 
                 # Удаляем из списка ожидающих
-                db.execute_query('DELETE FROM pending_users WHERE user_id = ?', (user_id,))
+                await db.execute('DELETE FROM pending_users WHERE user_id = ?', (user_id,))
                 
                 # Обновляем список
-                await list_access(callback.message)
+                await render_access_list(callback.message, db)
                 await callback.answer("✅ Доступ успешно выдан", show_alert=True)
                 
             except Exception as e:
@@ -851,12 +1049,12 @@ async def grant_access(callback: CallbackQuery):
         await callback.answer("❌ Произошла ошибка", show_alert=True)
 
 @router.callback_query(lambda c: c.data == "deny_all")
-async def deny_all_users(callback: CallbackQuery):
+async def deny_all_users(callback: CallbackQuery, db: Database):
     try:
-        # Получаем всех ожидающих пользователей
-        pending_users = db.execute_query('SELECT user_id FROM pending_users').fetchall()
+        # Отклоняем все заявки одной транзакцией
+        denied = await db.call(db.deny_pending_users)
         
-        for (user_id,) in pending_users:
+        for user_id in denied:
             try:
                 await callback.bot.send_message(
                     user_id,
@@ -865,9 +1063,6 @@ async def deny_all_users(callback: CallbackQuery):
             except Exception as e:
                 print(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
         
-        # Очищаем список ожидающих
-        db.execute_query('DELETE FROM pending_users')
-        
         await callback.message.edit_text("✅ Все запросы отклонены")
         await callback.answer("✅ Все запросы отклонены", show_alert=True)
         
@@ -876,7 +1071,7 @@ async def deny_all_users(callback: CallbackQuery):
         await callback.answer("❌ Произошла ошибка", show_alert=True) 
 
 @router.callback_query(lambda c: c.data.startswith('revoke_'))
-async def revoke_access(callback: CallbackQuery):
+async def revoke_access(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
     
@@ -884,7 +1079,7 @@ async def revoke_access(callback: CallbackQuery):
         user_id = int(callback.data.split('_')[1])
         
         # Удаляем пользователя из списка разрешенных
-        if db.remove_allowed_user(user_id):  # Используем метод из класса Database
+        if await db.call(db.remove_allowed_user, user_id):  # Используем метод из класса Database
             try:
                 # Уведомляем пользователя
                 await callback.bot.send_message(
@@ -904,21 +1099,21 @@ async def revoke_access(callback: CallbackQuery):
         await callback.answer("❌ Произошла ошибка", show_alert=True) 
 
 @router.callback_query(lambda c: c.data == "refresh_pending")
-async def refresh_pending_list(callback: CallbackQuery):
+async def refresh_pending_list(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
-    await show_pending_users(callback.message)
+    await render_pending_users(callback.message, db)
     await callback.answer("Список обновлен")
 
 @router.callback_query(lambda c: c.data == "refresh_allowed")
-async def refresh_allowed_list(callback: CallbackQuery):
+async def refresh_allowed_list(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
-    await show_allowed_users(callback.message)
+    await render_allowed_users(callback.message, db)
     await callback.answer("Список обновлен") 
 
 @router.callback_query(lambda c: c.data.startswith("approve_"))
-async def approve_user(callback: CallbackQuery):
+async def approve_user(callback: CallbackQuery, db: Database):
     if not is_admin(callback.from_user.id):
         return
     
@@ -931,7 +1126,7 @@ async def approve_user(callback: CallbackQuery):
         full_name = user.user.full_name
         
         # Добавляем пользователя с его реальным username
-        db.add_allowed_user(user_id, username, full_name)
+        await db.call(db.add_allowed_user, user_id, username, full_name)
         
         try:
             # Отправляем уведомление пользователю
@@ -942,11 +1137,10 @@ async def approve_user(callback: CallbackQuery):
             )
             
             # Удаляем из списка ожидающих
-            db.execute_query('DELETE FROM pending_users WHERE user_id = ?', (user_id,))
-            db.conn.commit()
+            await db.execute('DELETE FROM pending_users WHERE user_id = ?', (user_id,))
             
             # Обновляем список
-            await list_access(callback.message)
+            await render_access_list(callback.message, db)
             await callback.answer("✅ Доступ успешно выдан", show_alert=True)
             
         except Exception as e:
@@ -956,10 +1150,6 @@ async def approve_user(callback: CallbackQuery):
     except Exception as e:
         print(f"Ошибка при выдаче доступа: {e}")
         await callback.answer("❌ Произошла ошибка", show_alert=True)
-    finally:
-        # Закрываем соединение с базой данных
-        if hasattr(db, 'conn') and db.conn:
-            db.conn.close()
 
 class AssignTaskStates(StatesGroup):
     waiting_for_user = State()
@@ -967,16 +1157,16 @@ class AssignTaskStates(StatesGroup):
     waiting_for_description = State()
 
 @router.message(Command("assign_task"))
-async def start_assign_task(message: Message, state: FSMContext):
+async def start_assign_task(message: Message, state: FSMContext, db: Database):
     if not is_admin(message.from_user.id):
         return
         
     # Получаем список пользователей с доступом
-    users = db.execute_query('''
+    users = await db.fetchall('''
         SELECT user_id, username, full_name
         FROM allowed_users 
         WHERE user_id NOT IN ({})
-    '''.format(','.join(map(str, ADMIN_IDS)))).fetchall()
+    '''.format(','.join(map(str, ADMIN_IDS))))
     
     keyboard = []
     for user_id, username, full_name in users:
@@ -1010,10 +1200,11 @@ async def process_task_name(message: Message, state: FSMContext):
     await state.set_state(AssignTaskStates.waiting_for_description)
 
 @router.message(AssignTaskStates.waiting_for_description)
-async def process_task_description(message: Message, state: FSMContext):
+async def process_task_description(message: Message, state: FSMContext, db: Database):
     data = await state.get_data()
     
-    task_id = db.assign_task(
+    task_id = await db.call(
+        db.assign_task,
         admin_id=message.from_user.id,
         user_id=data['assigned_to'],
         task_name=data['task_name'],
@@ -1038,3 +1229,110 @@ async def process_task_description(message: Message, state: FSMContext):
     
     await state.clear()
 
+# Библиотека упражнений: добавление администратором
+@router.message(Command("add_exercise"))
+async def start_add_exercise(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return
+    
+    keyboard = [
+        [InlineKeyboardButton(text=name, callback_data=f"addex_cat:{code}")]
+        for code, name in EXERCISE_CATEGORIES.items()
+    ]
+    await message.answer(
+        "📚 Новое упражнение\n\nВыберите категорию (отменить — /cancel):",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+    )
+    await state.set_state(AddExerciseStates.waiting_for_category)
+
+@router.message(Command("cancel"), AddExerciseStates.waiting_for_category)
+@router.message(Command("cancel"), AddExerciseStates.waiting_for_title)
+@router.message(Command("cancel"), AddExerciseStates.waiting_for_video)
+@router.message(Command("cancel"), AddExerciseStates.waiting_for_description)
+async def cancel_add_exercise(message: Message, state: FSMContext):
+    await state.clear()
+    await message.answer("❌ Добавление упражнения отменено")
+
+@router.callback_query(AddExerciseStates.waiting_for_category, lambda c: c.data.startswith("addex_cat:"))
+async def process_exercise_category_choice(callback: CallbackQuery, state: FSMContext):
+    category = callback.data.split(":", 1)[1]
+    if category not in EXERCISE_CATEGORIES:
+        await callback.answer("❌ Неизвестная категория", show_alert=True)
+        return
+    
+    await state.update_data(category=category)
+    await callback.message.edit_text(f"📚 Категория: {EXERCISE_CATEGORIES[category]}")
+    await callback.message.answer("Введите название упражнения:")
+    await state.set_state(AddExerciseStates.waiting_for_title)
+    await callback.answer()
+
+@router.message(AddExerciseStates.waiting_for_title)
+async def process_exercise_title(message: Message, state: FSMContext):
+    if not message.text:
+        await message.answer("❌ Название должно быть текстом")
+        return
+    
+    await state.update_data(title=message.text[:200])
+    await message.answer("Отправьте видео или ссылку на него:")
+    await state.set_state(AddExerciseStates.waiting_for_video)
+
+@router.message(AddExerciseStates.waiting_for_video)
+async def process_exercise_video(message: Message, state: FSMContext):
+    if message.video:
+        await state.update_data(video_file_id=message.video.file_id, video_url=None)
+    elif message.text and message.text.startswith(("http://", "https://")):
+        await state.update_data(video_file_id=None, video_url=message.text.strip())
+    else:
+        await message.answer("❌ Отправьте видео файлом или ссылку, начинающуюся с http:// или https://")
+        return
+    
+    await message.answer("Введите описание упражнения:")
+    await state.set_state(AddExerciseStates.waiting_for_description)
+
+@router.message(AddExerciseStates.waiting_for_description)
+async def process_exercise_description(message: Message, state: FSMContext, db: Database):
+    description = message.text or ""
+    if utf16_len(description) > EXERCISE_DESCRIPTION_LIMIT:
+        await message.answer(
+            f"❌ Описание слишком длинное: {utf16_len(description)} символов, "
+            f"максимум {EXERCISE_DESCRIPTION_LIMIT}. Сократите его и отправьте ещё раз"
+        )
+        return
+    
+    data = await state.get_data()
+    
+    try:
+        exercise_id = await db.call(
+            db.add_exercise,
+            category=data['category'],
+            title=data['title'],
+            description=description,
+            video_url=data.get('video_url'),
+            video_file_id=data.get('video_file_id'),
+            created_by=message.from_user.id
+        )
+        await message.answer(
+            f"✅ Упражнение добавлено (ID {exercise_id})\n\n"
+            f"📚 {EXERCISE_CATEGORIES[data['category']]}\n"
+            f"📌 {data['title']}"
+        )
+    except Exception as e:
+        print(f"Ошибка при добавлении упражнения: {e}")
+        await message.answer("❌ Ошибка при добавлении упражнения")
+    
+    await state.clear()
+
+@router.message(Command("del_exercise"))
+async def delete_exercise(message: Message, db: Database):
+    if not is_admin(message.from_user.id):
+        return
+    
+    args = message.text.split()
+    if len(args) != 2 or not args[1].isdigit():
+        await message.answer("❌ Использование: /del_exercise ID")
+        return
+    
+    if await db.call(db.delete_exercise, int(args[1])):
+        await message.answer("✅ Упражнение удалено")
+    else:
+        await message.answer("❌ Упражнение не найдено")
@@ -5,68 +5,83 @@ from aiogram.fsm.context import FSMContext
 from datetime import datetime
 from keyboards.client_kb import get_main_keyboard
 from states.exercise_states import ExerciseStates
-from config import EXERCISE_CATEGORIES, EXERCISE_SEARCH_QUERIES
-from utils.youtube import search_youtube_video
-from handlers.access import access_middleware
+from config import EXERCISE_CATEGORIES
+from utils.video_catalog import VideoCatalog
+from utils.result_store import shown_videos
+from utils.text import CAPTION_LIMIT, utf16_len, truncate_utf16
+from handlers.access import access_middleware, show_exercises_menu
+from database import Database
+import html
 
 
 router = Router()
 
 # Изменяем обработчик для кнопки "Мои упражнения"
 @router.message(F.text == "🎯 Мои упражнения")
-async def show_exercise_categories(message: Message):
-    # Проверяем доступ
-    if not await access_middleware(message, message.bot):
+async def show_exercise_categories(message: Message, db: Database):
+    # При наличии доступа access_middleware сам показывает меню категорий
+    await access_middleware(message, message.bot, db)
+
+async def check_exercise_access(callback: CallbackQuery, db: Database) -> bool:
+    """Проверка доступа для кнопок упражнений (по тому, кто нажал, а не по сообщению бота)"""
+    if db.is_user_allowed(callback.from_user.id):
+        return True
+    await callback.answer("⚠️ Для доступа к упражнениям необходимо подписаться на канал и получить одобрение", show_alert=True)
+    return False
+
+@router.callback_query(lambda c: c.data.startswith('ex_'))
+async def process_exercise_category(callback: CallbackQuery, db: Database, catalog: VideoCatalog):
+    if not await check_exercise_access(callback, db):
         return
-        
-    keyboard = []
-    for code, name in EXERCISE_CATEGORIES.items():
-        keyboard.append([
+    await show_category_videos(callback, db, catalog, callback.data.replace('ex_', ''))
+
+VIDEOS_PER_PAGE = 5
+# Описание упражнения из библиотеки, в единицах UTF-16: вместе с названием
+# должно помещаться в подпись к видео (CAPTION_LIMIT)
+EXERCISE_DESCRIPTION_LIMIT = 800
+
+def format_duration(seconds: int) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def exercise_buttons(exercises) -> list:
+    """Кнопки упражнений из библиотеки"""
+    return [
+        [
             types.InlineKeyboardButton(
-                text=f"➤ {name}",
-                callback_data=f"ex_{code}"
+                text=f"⭐ {exercise['title'][:40]}",
+                callback_data=f"exr:{exercise['exercise_id']}"
             )
-        ])
-    
-    markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-    await message.answer(
-        "<b>🎯 Видео-упражнения</b>\n\n"
-        "<i>Выберите категорию упражнений:</i>\n\n"
-        "• Каждая категория содержит специально подобранные видео\n"
-        "• Выполняйте упражнения регулярно\n"
-        "• Следите за техникой выполнения\n",
-        reply_markup=markup,
-        parse_mode="HTML"
-    )
-
-@router.callback_query(lambda c: c.data.startswith(('ex_', 'video:')))
-async def exercise_callback(callback: CallbackQuery):
-    # Проверяем доступ
-    if not await access_middleware(callback.message, callback.bot):
-        await callback.answer("⚠️ Для доступа к упражнениям необходимо подписаться на канал и получить одобрение", show_alert=True)
-        return
-        
-    # Остальной код обработки callback
+        ]
+        for exercise in exercises
+    ]
 
-@router.callback_query(lambda c: c.data.startswith('ex_'))
-async def process_exercise_category(callback: CallbackQuery):
-    category_code = callback.data.replace('ex_', '')
+async def show_category_videos(callback: CallbackQuery, db: Database, catalog: VideoCatalog,
+                               category_code: str, offset: int = 0) -> bool:
+    """Показывает упражнения категории из библиотеки (на первой странице) и страницу
+    видео из каталога. Возвращает False, если не нашлось ни того, ни другого"""
     if category_code in EXERCISE_CATEGORIES:
         category_name = EXERCISE_CATEGORIES[category_code]
         
-        videos = search_youtube_video(EXERCISE_SEARCH_QUERIES[category_code], max_results=5, force_update=True)
+        curated = await db.call(db.get_category_exercises, category_code) if offset == 0 else []
+        videos, next_offset = await catalog.get_page(category_code, offset, VIDEOS_PER_PAGE)
         
-        if videos:
-            keyboard = []
-            for i, video in enumerate(videos, 1):
+        if curated or videos:
+            # Упражнения, добавленные логопедом, — выше видео с YouTube
+            keyboard = exercise_buttons(curated)
+            for video in videos:
                 title = video['title']
                 if len(title) > 40:
                     title = title[:37] + "..."
+                if video.get('duration'):
+                    title = f"{title} · {format_duration(video['duration'])}"
                 
                 keyboard.append([
                     types.InlineKeyboardButton(
                         text=f"📺 {title}",
-                        callback_data=f"video:{category_code}:{i-1}"
+                        # ID видео в callback: кнопка всегда открывает то, что видел пользователь
+                        callback_data=f"video:{category_code}:{video['video_id']}"
                     )
                 ])
             
@@ -75,7 +90,8 @@ async def process_exercise_category(callback: CallbackQuery):
                 [
                     types.InlineKeyboardButton(
                         text="🔄 Обновить список",
-                        callback_data=f"refresh:{category_code}"
+                        # Следующая страница того же набора результатов
+                        callback_data=f"refresh:{category_code}:{next_offset}"
                     )
                 ],
                 [
@@ -88,81 +104,179 @@ async def process_exercise_category(callback: CallbackQuery):
             
             markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
             
-            if not hasattr(callback.bot, 'videos'):
-                callback.bot.videos = {}
-            callback.bot.videos[category_code] = videos
+            shown_videos.set((callback.from_user.id, category_code), videos)
             
-            await callback.message.edit_text(
+            text = (
                 f"<b>🎯 {category_name}</b>\n\n"
-                f"<i>Выберите видео для просмотра:</i>\n",
-                reply_markup=markup,
-                parse_mode="HTML"
+                f"<i>Выберите видео для просмотра:</i>\n"
             )
+            if callback.message.text is None:
+                # Возврат из карточки с видео: текст медиа-сообщения не отредактировать
+                await callback.message.answer(text, reply_markup=markup, parse_mode="HTML")
+            else:
+                await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+            return True
+    return False
 
 @router.callback_query(lambda c: c.data.startswith('refresh:'))
-async def refresh_videos(callback: CallbackQuery):
+async def refresh_videos(callback: CallbackQuery, db: Database, catalog: VideoCatalog):
+    if not await check_exercise_access(callback, db):
+        return
     try:
-        _, category_code = callback.data.split(':')
+        _, category_code, *offset = callback.data.split(':')
+        # У кнопок из старых сообщений смещения нет
+        offset = int(offset[0]) if offset else VIDEOS_PER_PAGE
         if category_code in EXERCISE_CATEGORIES:
             # Показываем уведомление о начале обновления
             await callback.answer("🔄 Обновляем список видео...")
             
-            # Получаем новые видео с принудительным обновлением
-            videos = search_youtube_video(
-                EXERCISE_SEARCH_QUERIES[category_code], 
-                max_results=5, 
-                force_update=True
-            )
-            
-            if videos:
-                # Перенаправляем на показ обновленного списка
-                callback.data = f"ex_{category_code}"
-                await process_exercise_category(callback)
-            else:
-                await callback.answer("❌ Не удалось загрузить видео")
+            # Показываем следующие видео категории
+            if not await show_category_videos(callback, db, catalog, category_code, offset):
+                await callback.message.answer("❌ Не удалось загрузить видео")
     except Exception as e:
         print(f"Ошибка при обновлении видео: {e}")
         await callback.answer("❌ Ошибка обновления")
 
 @router.callback_query(lambda c: c.data.startswith('video:'))  # Изменили разделитель на :
-async def confirm_watch_video(callback: CallbackQuery):
+async def confirm_watch_video(callback: CallbackQuery, db: Database, catalog: VideoCatalog):
+    if not await check_exercise_access(callback, db):
+        return
     try:
-        _, category_code, video_idx = callback.data.split(':')  # Используем : вместо _
-        video_idx = int(video_idx)
+        _, category_code, video_id = callback.data.split(':')  # Используем : вместо _
         
-        videos = getattr(callback.bot, 'videos', {}).get(category_code, [])
+        # Название берём из показанного пользователю списка, затем из каталога
+        videos = shown_videos.get((callback.from_user.id, category_code)) or []
+        video = next((v for v in videos if v['video_id'] == video_id), None)
+        video = video or catalog.find(category_code, video_id) or {
+            'title': "Видео-упражнение",
+            'url': f"https://www.youtube.com/watch?v={video_id}"
+        }
         
-        if videos and video_idx < len(videos):
-            video = videos[video_idx]
-            keyboard = [
-                [
-                    types.InlineKeyboardButton(
-                        text="▶️ Смотреть видео",
-                        url=video['url']
-                    )
-                ],
-                [
-                    types.InlineKeyboardButton(
-                        text="◀️ Назад к списку",
-                        callback_data=f"ex_{category_code}"
-                    )
-                ]
+        keyboard = [
+            [
+                types.InlineKeyboardButton(
+                    text="▶️ Смотреть видео",
+                    url=video['url']
+                )
+            ],
+            [
+                types.InlineKeyboardButton(
+                    text="◀️ Назад к списку",
+                    callback_data=f"ex_{category_code}"
+                )
             ]
-            
-            markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-            
-            await callback.message.edit_text(
-                f"<b>📺 {video['title']}</b>\n\n"
-                "Нажмите <b>▶️ Смотреть видео</b>, чтобы начать просмотр\n\n"
-                "<i>💡 Совет: Выполняйте упражнение вместе с видео</i>",
+        ]
+        
+        markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
+        
+        details = ""
+        if video.get('channel'):
+            details += f"📡 {html.escape(video['channel'])}\n"
+        if video.get('duration'):
+            details += f"⏱ {format_duration(video['duration'])}\n"
+        if video.get('views') is not None:
+            details += f"👁 {video['views']:,} просмотров\n".replace(',', ' ')
+        
+        await callback.message.edit_text(
+            f"<b>📺 {html.escape(video['title'])}</b>\n\n"
+            + (details + "\n" if details else "") +
+            "Нажмите <b>▶️ Смотреть видео</b>, чтобы начать просмотр\n\n"
+            "<i>💡 Совет: Выполняйте упражнение вместе с видео</i>",
+            reply_markup=markup,
+            parse_mode="HTML"
+        )
+    except Exception as e:
+        print(f"Ошибка при обработке callback: {e}")
+        await callback.answer("Произошла ошибка. Попробуйте еще раз.")
+
+@router.callback_query(lambda c: c.data == "back_to_categories")
+async def back_to_categories(callback: CallbackQuery, db: Database):
+    if not await check_exercise_access(callback, db):
+        return
+    await show_exercises_menu(callback.message)
+    await callback.answer()
+
+# Упражнение из библиотеки
+@router.callback_query(lambda c: c.data.startswith('exr:'))
+async def show_library_exercise(callback: CallbackQuery, db: Database):
+    if not await check_exercise_access(callback, db):
+        return
+    try:
+        exercise = await db.call(db.get_exercise, int(callback.data.split(':')[1]))
+        if not exercise:
+            await callback.answer("❌ Упражнение больше недоступно", show_alert=True)
+            return
+        
+        keyboard = []
+        if exercise['video_url']:
+            keyboard.append([
+                types.InlineKeyboardButton(text="▶️ Смотреть видео", url=exercise['video_url'])
+            ])
+        keyboard.append([
+            types.InlineKeyboardButton(
+                text="◀️ Назад к списку",
+                callback_data=f"ex_{exercise['category']}"
+            )
+        ])
+        markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
+        
+        title = f"⭐ {exercise['title']}"
+        tip = "💡 Совет: Выполняйте упражнение вместе с видео"
+        # Лимит Telegram считается по тексту без разметки: обрезаем описание
+        # до экранирования, чтобы не разорвать теги и сущности вроде &amp;
+        budget = CAPTION_LIMIT - utf16_len(title) - utf16_len(tip) - 4
+        description = truncate_utf16(exercise['description'] or "", min(budget, EXERCISE_DESCRIPTION_LIMIT))
+        
+        text = f"<b>{html.escape(title)}</b>\n\n"
+        if description:
+            text += f"{html.escape(description)}\n\n"
+        text += f"<i>{tip}</i>"
+        
+        if exercise['video_file_id']:
+            # Видео загружено в Telegram — отправляем его самим сообщением
+            await callback.message.answer_video(
+                exercise['video_file_id'],
+                caption=text,
                 reply_markup=markup,
                 parse_mode="HTML"
             )
+        else:
+            await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+        await callback.answer()
     except Exception as e:
-        print(f"Ошибка при обработке callback: {e}")
+        print(f"Ошибка при показе упражнения: {e}")
         await callback.answer("Произошла ошибка. Попробуйте еще раз.")
 
-@router.callback_query(lambda c: c.data == "back_to_categories")
-async def back_to_categories(callback: CallbackQuery):
-    await show_exercise_categories(callback.message)
-    await callback.answer()
\ No newline at end of file
+# Поиск по библиотеке упражнений
+@router.callback_query(lambda c: c.data == "search_exercises")
+async def start_exercise_search(callback: CallbackQuery, state: FSMContext, db: Database):
+    if not await check_exercise_access(callback, db):
+        return
+    await state.set_state(ExerciseStates.searching)
+    await callback.message.answer("🔍 Введите слова для поиска упражнения (например: «язык» или «выдох»):")
+    await callback.answer()
+
+@router.message(ExerciseStates.searching)
+async def search_exercises(message: Message, state: FSMContext, db: Database):
+    await state.clear()
+    if not message.text:
+        await message.answer("❌ Введите запрос текстом")
+        return
+    
+    try:
+        exercises = await db.call(db.search_exercises, message.text)
+    except Exception as e:
+        print(f"Ошибка поиска упражнений: {e}")
+        await message.answer("❌ Произошла ошибка при поиске")
+        return
+    
+    keyboard = exercise_buttons(exercises)
+    keyboard.append([
+        types.InlineKeyboardButton(text="🔍 Искать ещё", callback_data="search_exercises")
+    ])
+    markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
+    
+    if exercises:
+        await message.answer(f"🔍 Найдено упражнений: {len(exercises)}", reply_markup=markup)
+    else:
+        await message.answer("🔍 Ничего не найдено. Попробуйте другие слова.", reply_markup=markup)
\ No newline at end of file
@@ -15,7 +15,6 @@ from keyboards.schedule_kb import (
 from states.schedule_states import ScheduleStates
 
 router = Router()
-db = Database()
 
 # Админ-панель управления расписанием
 @router.message(lambda m: m.from_user.id in ADMIN_IDS and m.text == "📅 Календарь")
@@ -32,7 +31,7 @@ async def schedule_admin_panel(message: Message):
 
 # Обработчик всех callback-запросов для отладки
 @router.callback_query()
-async def process_callback(callback: CallbackQuery, state: FSMContext):
+async def process_callback(callback: CallbackQuery, state: FSMContext, db: Database):
     print(f"Получен callback: {callback.data}")  # Отладка
     
     try:
@@ -40,13 +39,13 @@ async def process_callback(callback: CallbackQuery, state: FSMContext):
             await start_add_work_hours(callback, state)
         
         elif callback.data == "view_appointments":
-            await view_appointments(callback)
+            await view_appointments(callback, db)
         
         elif callback.data == "cancel_appointment":
-            await start_cancel_appointment(callback, state)
+            await start_cancel_appointment(callback, state, db)
         
         elif callback.data.startswith("cancel_slot_"):
-            await cancel_specific_appointment(callback, state)
+            await cancel_specific_appointment(callback, state, db)
         
         elif callback.data.startswith("date_"):
             await process_selected_date(callback, state)
@@ -55,7 +54,7 @@ async def process_callback(callback: CallbackQuery, state: FSMContext):
             await process_selected_time(callback, state)
         
         elif callback.data == "confirm_schedule":
-            await confirm_schedule(callback, state)
+            await confirm_schedule(callback, state, db)
         
         elif callback.data == "cancel_schedule":
             await cancel_schedule(callback, state)
@@ -88,12 +87,12 @@ async def start_add_work_hours(callback: CallbackQuery, state: FSMContext):
     finally:
         await callback.answer()
 
-async def view_appointments(callback: CallbackQuery):
+async def view_appointments(callback: CallbackQuery, db: Database):
     try:
         print("Просмотр записей")  # Отладка
         await callback.message.edit_text("🔄 Загрузка записей...")
         
-        appointments = db.get_all_appointments()
+        appointments = await db.call(db.get_all_appointments)
         print(f"Получены записи: {appointments}")  # Отладка
         
         kb = InlineKeyboardBuilder()
@@ -173,7 +172,7 @@ async def process_selected_time(callback: CallbackQuery, state: FSMContext):
 
 # Подтверждение выбора
 @router.callback_query(lambda c: c.data == "confirm_schedule")
-async def confirm_schedule(callback: CallbackQuery, state: FSMContext):
+async def confirm_schedule(callback: CallbackQuery, state: FSMContext, db: Database):
     try:
         data = await state.get_data()
         date = data.get('selected_date')
@@ -188,7 +187,7 @@ async def confirm_schedule(callback: CallbackQuery, state: FSMContext):
         
         # Сохраняем слоты в базу
         for slot in slots:
-            db.add_work_slot(date, slot)
+            await db.call(db.add_work_slot, date, slot)
         
         await callback.message.edit_text(
             f"✅ Рабочие часы на {date} добавлены:\n"
@@ -234,10 +233,10 @@ async def back_to_schedule(callback: CallbackQuery):
     await callback.answer()
 
 # Добавляем новые функции для отмены записей
-async def start_cancel_appointment(callback: CallbackQuery, state: FSMContext):
+async def start_cancel_appointment(callback: CallbackQuery, state: FSMContext, db: Database):
     try:
         # Получаем все активные записи
-        appointments = db.get_all_appointments()
+        appointments = await db.call(db.get_all_appointments)
         
         if not appointments:
             try:
@@ -295,13 +294,13 @@ async def start_cancel_appointment(callback: CallbackQuery, state: FSMContext):
     finally:
         await callback.answer()
 
-async def cancel_specific_appointment(callback: CallbackQuery, state: FSMContext):
+async def cancel_specific_appointment(callback: CallbackQuery, state: FSMContext, db: Database):
     try:
         # Получаем дату и время из callback_data
         _, date, time = callback.data.split('_', 2)
         
         # Отменяем запись в базе
-        db.cancel_appointment(date, time)
+        await db.call(db.cancel_appointment, date, time)
         
         await callback.message.edit_text(
             f"✅ Запись на {date} {time} успешно отменена",
@@ -1,50 +1,134 @@
 from aiogram import Router
 from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
 from database import Database
+from utils.text import MESSAGE_LIMIT, utf16_len, truncate_utf16
 
 router = Router()
-db = Database()
 
-@router.message(lambda m: m.text == "📝 Мои задания")
-async def show_user_tasks(message: Message):
-    user_id = message.from_user.id
-    
-    # Получаем личные и назначенные задания
-    own_tasks = db.get_user_tasks(user_id)
-    assigned_tasks = db.get_assigned_tasks(user_id)
-    
-    if not own_tasks and not assigned_tasks:
-        await message.answer("У вас пока нет заданий")
+TASKS_PAGE_SIZE = 10        # Сколько заданий запрашивать за раз
+TASK_NAME_LIMIT = 200       # Длинные название и описание обрезаются,
+TASK_DESCRIPTION_LIMIT = 500  # чтобы одно задание не занимало всю страницу
+# Размер страницы в единицах UTF-16, с запасом под номер страницы
+PAGE_BUDGET = MESSAGE_LIMIT - 100
+
+
+def format_task(task) -> str:
+    name = truncate_utf16(task['task_name'] or '', TASK_NAME_LIMIT)
+    description = truncate_utf16(task['description'] or '', TASK_DESCRIPTION_LIMIT)
+    if task['kind'] == 'assigned':
+        status = "✅" if task['completed'] else "⏳"
+        return f"{status} {name}\n📝 {description}\n\n"
+    hours = task['total_duration'] // 3600
+    minutes = (task['total_duration'] % 3600) // 60
+    return (
+        f"📌 {name}\n"
+        f"📝 {description}\n"
+        f"⏱ Затрачено: {hours}ч {minutes}мин\n\n"
+    )
+
+
+def task_block(task, section) -> str:
+    """Задание с заголовком раздела, если с него раздел начинается"""
+    header = ""
+    if task['kind'] != section:
+        header = "📋 Назначенные задания:\n\n" if task['kind'] == 'assigned' else "📝 Личные задания:\n\n"
+    return header + format_task(task)
+
+
+def task_buttons(task) -> list:
+    prefix = "assigned" if task['kind'] == 'assigned' else "task"
+    return [
+        InlineKeyboardButton(text="▶️ Старт", callback_data=f"start_{prefix}_{task['task_id']}"),
+        InlineKeyboardButton(text="⏹ Стоп", callback_data=f"stop_{prefix}_{task['task_id']}"),
+    ]
+
+
+async def previous_page_offset(db: Database, user_id: int, offset: int, own_only: bool) -> int:
+    """Начало страницы перед offset: столько заданий, сколько влезает в сообщение"""
+    start = max(0, offset - TASKS_PAGE_SIZE)
+    tasks = await db.call(db.get_task_page, user_id, start, offset - start, own_only)
+    previous = offset - len(tasks)
+    # Добавляем задания с конца, пока страница, начинающаяся с них, влезает
+    for index in range(len(tasks) - 1, -1, -1):
+        text = ""
+        section = None
+        for task in tasks[index:]:
+            text += task_block(task, section)
+            section = task['kind']
+        if index < len(tasks) - 1 and utf16_len(text) > PAGE_BUDGET:
+            return start + index + 1
+        previous = start + index
+    return previous
+
+
+async def render_tasks_page(message: Message, db: Database, user_id: int, offset: int = 0,
+                            own_only: bool = False, edit: bool = False, previous: int = None):
+    """Показывает одну страницу заданий.
+
+    Запрашивает TASKS_PAGE_SIZE + 1 строк, выводит столько, сколько влезает в
+    лимит сообщения Telegram (по длине в UTF-16), следующая страница начинается
+    с первого не поместившегося задания. Страницы разной длины, поэтому «Назад»
+    ведёт на previous — начало страницы, с которой пришли по «Далее»; если его
+    нет, предыдущая страница отмеряется от offset назад.
+    """
+    tasks = await db.call(db.get_task_page, user_id, offset, TASKS_PAGE_SIZE + 1, own_only)
+
+    if not tasks:
+        if own_only:
+            await message.answer("У вас пока нет заданий. Создать новое: /new_task")
+        else:
+            await message.answer("У вас пока нет заданий")
         return
-        
+
+    scope = "own" if own_only else "all"
     text = ""
     keyboard = []
-    
-    if assigned_tasks:
-        text += "📋 Назначенные задания:\n\n"
-        for task in assigned_tasks:
-            task_id, name, description, created_at, completed = task
-            status = "✅" if completed else "⏳"
-            text += f"{status} {name}\n"
-            text += f"📝 {description}\n\n"
-            
-            if not completed:
-                keyboard.append([
-                InlineKeyboardButton(
-                    text="▶️ Старт",
-                    callback_data=f"start_assigned_{task_id}"
-                ),
-                InlineKeyboardButton(
-                    text="⏹ Стоп",  # Была обрезана
-                    callback_data=f"stop_assigned_{task_id}"
-                )
-            ])
-            
-    if own_tasks:
-        text += "\n📝 Личные задания:\n\n"
-        for task in own_tasks:
-            task_id, name, description, created_at = task
-            text += f"📌 {name}\n"
-            text += f"📝 {description}\n\n"
-    
-    await message.answer(text) 
\ No newline at end of file
+    section = None
+    shown = 0
+
+    for task in tasks[:TASKS_PAGE_SIZE]:
+        block = task_block(task, section)
+        if shown and utf16_len(text) + utf16_len(block) > PAGE_BUDGET:
+            break
+        text += block
+        section = task['kind']
+        shown += 1
+        if not (task['kind'] == 'assigned' and task['completed']):
+            keyboard.append(task_buttons(task))
+
+    has_next = shown < len(tasks)
+    navigation = []
+    if offset > 0:
+        if previous is None or previous >= offset:
+            previous = await previous_page_offset(db, user_id, offset, own_only)
+        navigation.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=f"tpage:{scope}:{previous}"
+        ))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            text="Далее ➡️",
+            callback_data=f"tpage:{scope}:{offset + shown}:{offset}"
+        ))
+    if navigation:
+        keyboard.append(navigation)
+        text += f"Задания {offset + 1}–{offset + shown}"
+
+    if own_only:
+        keyboard.append([
+            InlineKeyboardButton(
+                text="➕ Новое задание",
+                callback_data="new_task"
+            )
+        ])
+
+    markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+    if edit:
+        await message.edit_text(text, reply_markup=markup)
+    else:
+        await message.answer(text, reply_markup=markup)
+
+
+@router.message(lambda m: m.text == "📝 Мои задания")
+async def show_user_tasks(message: Message, db: Database):
+    await render_tasks_page(message, db, message.from_user.id)
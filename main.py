@@ -2,7 +2,7 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher, types
 from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN, ADMIN_IDS
+from config import BOT_TOKEN, ADMIN_IDS, VIDEO_WARMUP_TIMEOUT
 from handlers import admin, client, exercises, schedule, access, tasks
 from aiogram.types import BotCommand
 from handlers.access import access_middleware
@@ -13,20 +13,32 @@ from datetime import datetime
 import os
 import signal
 from database import Database
+from utils.maintenance import Maintenance
+from utils.video_catalog import VideoCatalog
+from utils.quota import QuotaManager
 
     # Инициализируем бота и диспетчер
 bot = Bot(token=BOT_TOKEN)
 storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+# Единственный экземпляр базы данных на процесс: попадает в хендлеры
+# через workflow data диспетчера как аргумент `db`
+db = Database()
+# Фоновое обслуживание базы; в хендлерах доступно как `maintenance`
+maintenance = Maintenance(db)
+# Учёт квоты YouTube и кэш видео упражнений; в хендлерах — `quota` и `catalog`
+quota = QuotaManager(db)
+catalog = VideoCatalog(db, quota)
+dp = Dispatcher(storage=storage, db=db, maintenance=maintenance, catalog=catalog, quota=quota)
 
 
 # Регистрируем роутеры в правильном порядке
 dp.include_router(access.router)
 dp.include_router(admin.router)  # Сначала админский роутер
-dp.include_router(client.router)
+# Задания и упражнения — до client и schedule: у них обработчики без фильтров ловят всё подряд
+dp.include_router(tasks.router)
 dp.include_router(exercises.router)
+dp.include_router(client.router)
 dp.include_router(schedule.router)
-dp.include_router(tasks.router)
 
 async def set_commands(bot: Bot):
     commands = [
@@ -91,13 +103,13 @@ class AccessMiddleware:
         if isinstance(event, types.Message):
             # Проверяем, является ли команда из раздела упражнений
             if event.text and event.text.startswith(('🎯 Упражнения', '/exercise')):
-                if not await access_middleware(event, data['bot']):
+                if not await access_middleware(event, data['bot'], data['db']):
                     return
             # Для остальных команд пропускаем проверку
         elif isinstance(event, types.CallbackQuery):
             # Проверяем callback-запросы для упражнений
             if event.data and event.data.startswith(('ex_', 'video:')):
-                if not await access_middleware(event.message, data['bot']):
+                if not await access_middleware(event.message, data['bot'], data['db']):
                     await event.answer("⚠️ Для доступа к упражнениям необходимо подписаться на канал и получить доступ", show_alert=True)
                     return
         return await handler(event, data)
@@ -117,6 +129,19 @@ def save_restart_status(status: str, error: str = None):
 
 async def on_startup(bot: Bot):
     """Действия при запуске бота"""
+    # Частые записи (таймеры, заявки) коммитим пачками
+    await db.start_writer()
+    maintenance.start()
+    
+    # Прогреваем каталог видео до начала приёма сообщений. Долгий или
+    # неудачный прогрев не мешает запуску: недогретые категории догрузятся по запросу
+    try:
+        await asyncio.wait_for(catalog.warm_up(), timeout=VIDEO_WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        logging.warning(f"Прогрев каталога видео не уложился в {VIDEO_WARMUP_TIMEOUT} с")
+    except Exception as e:
+        logging.error(f"Ошибка прогрева каталога видео: {e}")
+    
     try:
         # Проверяем, был ли это рестарт
         if os.path.exists('restart_chat.txt'):
@@ -148,9 +173,6 @@ async def main():
         
         await set_commands(bot)
         
-        # Инициализация базы данных (только один раз)
-        db = Database()
-        
         # Удаляем все обновления, которые произошли после последнего завершения работы бота
         await bot.delete_webhook(drop_pending_updates=True)
         
@@ -159,7 +181,10 @@ async def main():
         save_restart_status('error', str(e))
         print(f'Ошибка: {e}')
     finally:
+        await maintenance.stop()
+        await db.stop_writer()
         await bot.session.close()
+        db.shutdown()
 
 if __name__ == '__main__':
     # Регистрируем обработчики сигналов
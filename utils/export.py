@@ -0,0 +1,68 @@
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+
+# Таблицы, которые можно выгрузить, и порядок строк в выгрузке
+EXPORT_TABLES = {
+    'allowed_users': 'user_id',
+    'tasks': 'task_id',
+    'assigned_tasks': 'task_id',
+    'task_timers': 'timer_id',
+}
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+# Сколько строк читается с курсора за раз: память не зависит от размера таблицы
+FETCH_SIZE = 500
+
+
+def export_table(db_path: str, table: str, fmt: str = 'csv', compress: bool = False) -> str:
+    """Выгружает таблицу во временный файл и возвращает путь к нему.
+
+    Читает через отдельное соединение только для чтения (в WAL оно не мешает
+    записи бота), строки пишутся в файл порциями по FETCH_SIZE.
+    Файл удаляет вызывающий код.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Таблица {table} недоступна для выгрузки")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат {fmt}")
+
+    suffix = f".{fmt}.gz" if compress else f".{fmt}"
+    prefix = f"{table}_{datetime.now():%Y%m%d_%H%M%S}_"
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix=prefix)
+    os.close(fd)
+
+    conn = None
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        cursor = conn.execute(f'SELECT * FROM {table} ORDER BY {EXPORT_TABLES[table]}')
+        columns = [column[0] for column in cursor.description]
+
+        raw = gzip.open(path, 'wb') if compress else open(path, 'wb')
+        with io.TextIOWrapper(raw, encoding='utf-8', newline='') as out:
+            if fmt == 'csv':
+                writer = csv.writer(out)
+                writer.writerow(columns)
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                if fmt == 'csv':
+                    writer.writerows(rows)
+                else:
+                    for row in rows:
+                        out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                        out.write('\n')
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+    return path
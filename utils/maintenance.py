@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from database import Database
+from config import MAINTENANCE_INTERVAL, ORPHAN_TIMER_HOURS, PENDING_USER_TTL_DAYS
+
+
+class Maintenance:
+    """Периодическое обслуживание SQLite: забытые таймеры, старые заявки,
+    статистика планировщика и возврат свободных страниц.
+
+    Работа идёт пачками по batch_size строк — каждая пачка отдельной короткой
+    транзакцией через поток БД, между пачками хендлеры успевают писать.
+    """
+
+    def __init__(self, db: Database, interval: int = MAINTENANCE_INTERVAL,
+                 batch_size: int = 200, vacuum_pages: int = 500):
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.last_report: Optional[Dict] = None
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    async def _in_batches(self, func, *args) -> int:
+        total = 0
+        while True:
+            done = await self.db.call(func, *args, self.batch_size)
+            total += done
+            if done < self.batch_size:
+                return total
+            # Отдаём поток БД запросам пользователей
+            await asyncio.sleep(0.05)
+
+    async def run_once(self) -> Dict:
+        """Выполняет все задачи обслуживания и возвращает отчёт"""
+        async with self._lock:
+            started = time.perf_counter()
+            report = {'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            jobs = [
+                ('orphan_timers', self._in_batches, self.db.close_orphan_timers, ORPHAN_TIMER_HOURS),
+                ('stale_pending', self._in_batches, self.db.purge_stale_pending_users, PENDING_USER_TTL_DAYS),
+                ('analyzed', self.db.call, self.db.optimize),
+                ('vacuumed_pages', self.db.call, self.db.incremental_vacuum, self.vacuum_pages),
+            ]
+            for name, runner, *args in jobs:
+                # Сбой одной задачи не мешает остальным
+                try:
+                    report[name] = await runner(*args)
+                except Exception as e:
+                    logging.error(f"Ошибка обслуживания БД ({name}): {e}")
+                    report[name] = f"ошибка: {e}"
+            report['elapsed_ms'] = (time.perf_counter() - started) * 1000
+            self.last_report = report
+            logging.info(f"Обслуживание БД: {report}")
+            return report
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
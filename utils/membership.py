@@ -0,0 +1,62 @@
+import time
+from typing import Dict, Optional, Tuple
+from aiogram import Bot
+from config import CHANNEL_ID, MEMBERSHIP_CACHE_TTL, MEMBERSHIP_CACHE_NEGATIVE_TTL
+
+
+class MembershipCache:
+    """Кэш проверок подписки на канал: user_id -> (подписан, момент истечения)"""
+
+    def __init__(self, positive_ttl: int, negative_ttl: int, max_size: int = 10000):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: Dict[int, Tuple[bool, float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[bool]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] <= time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, user_id: int, is_member: bool):
+        now = time.monotonic()
+        if len(self._entries) >= self.max_size:
+            # Выбрасываем протухшие записи, а если не помогло — самые старые
+            self._entries = {
+                key: value for key, value in self._entries.items() if value[1] > now
+            }
+            while len(self._entries) >= self.max_size:
+                self._entries.pop(next(iter(self._entries)))
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        self._entries[user_id] = (is_member, now + ttl)
+
+    def bust(self, user_id: int):
+        """Сбрасывает кэш пользователя (например, по кнопке «Проверить подписку»)"""
+        self._entries.pop(user_id, None)
+
+    async def is_subscribed(self, bot: Bot, user_id: int) -> bool:
+        """Проверяет подписку на канал, обращаясь к Telegram только при промахе кэша"""
+        cached = self.get(user_id)
+        if cached is not None:
+            return cached
+        member = await bot.get_chat_member(CHANNEL_ID, user_id)
+        is_member = member.status not in ['left', 'kicked', 'banned']
+        self.set(user_id, is_member)
+        return is_member
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+membership_cache = MembershipCache(MEMBERSHIP_CACHE_TTL, MEMBERSHIP_CACHE_NEGATIVE_TTL)
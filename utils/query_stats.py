@@ -0,0 +1,86 @@
+import re
+import logging
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Deque, Dict, List
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql: str) -> str:
+    """Нормализует SQL: литералы -> ?, списки IN -> (...), пробелы схлопываются"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class _StatementStats:
+    __slots__ = ('count', 'total', 'max', 'samples')
+
+    def __init__(self, sample_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # Последние замеры — по ним считаются перцентили
+        self.samples: Deque[float] = deque(maxlen=sample_size)
+
+
+class QueryStats:
+    """Статистика времени выполнения запросов по отпечаткам SQL"""
+
+    def __init__(self, slow_query_ms: int, sample_size: int = 512):
+        self.slow_query_ms = slow_query_ms
+        self.sample_size = sample_size
+        self._stats: Dict[str, _StatementStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, seconds: float):
+        key = fingerprint(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _StatementStats(self.sample_size)
+            stats.count += 1
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            stats.samples.append(seconds)
+
+        if seconds * 1000 >= self.slow_query_ms:
+            logging.warning(f"Медленный запрос ({seconds * 1000:.1f} мс): {key}")
+
+    def top(self, limit: int = 10) -> List[dict]:
+        """Запросы с наибольшим суммарным временем, времена в миллисекундах"""
+        with self._lock:
+            items = [
+                (key, stats.count, stats.total, stats.max, sorted(stats.samples))
+                for key, stats in self._stats.items()
+            ]
+        items.sort(key=lambda item: item[2], reverse=True)
+
+        result = []
+        for key, count, total, max_time, samples in items[:limit]:
+            result.append({
+                'sql': key,
+                'count': count,
+                'total_ms': total * 1000,
+                'p50_ms': _percentile(samples, 0.50) * 1000,
+                'p95_ms': _percentile(samples, 0.95) * 1000,
+                'max_ms': max_time * 1000,
+            })
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[round(q * (len(samples) - 1))]
@@ -0,0 +1,139 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+from database import Database
+from config import YOUTUBE_DAILY_QUOTA, YOUTUBE_QUOTA_RESERVE, YOUTUBE_BURST, YOUTUBE_RATE_PER_MIN
+
+try:
+    from zoneinfo import ZoneInfo
+    PACIFIC = ZoneInfo('America/Los_Angeles')
+except Exception:
+    # Нет базы часовых поясов (Windows без tzdata) — стандартное время без перехода на летнее
+    PACIFIC = timezone(timedelta(hours=-8))
+
+# Стоимость методов YouTube Data API в единицах квоты
+COSTS = {
+    'search': 100,
+    'videos': 1,
+}
+# Частоту ограничиваем только для поиска: videos.list идёт следом за каждым
+# поиском и стоит 1 единицу, в общем bucket он вытеснял бы сами поиски
+RATE_LIMITED = {'search'}
+
+
+class QuotaManager:
+    """Учёт суточной квоты YouTube Data API и ограничение частоты запросов.
+
+    Квота YouTube обнуляется в полночь по тихоокеанскому времени, расход за день
+    хранится в таблице youtube_quota. Последние reserve единиц тратятся только
+    на приоритетные запросы (категория, для которой нет ни одного видео),
+    остальные в это время получают отказ и пользуются кэшем.
+    Частоту поисков ограничивает token bucket: burst запросов подряд, далее
+    rate_per_min в минуту; дешёвые videos.list учитываются только в квоте.
+    """
+
+    UPSERT_QUERY = '''INSERT INTO youtube_quota (day, units, calls, rejected, throttled)
+                      VALUES (?, ?, ?, ?, ?)
+                      ON CONFLICT (day) DO UPDATE SET
+                          units = excluded.units, calls = excluded.calls,
+                          rejected = excluded.rejected, throttled = excluded.throttled'''
+
+    def __init__(self, db: Database, daily_limit: int = YOUTUBE_DAILY_QUOTA,
+                 reserve: int = YOUTUBE_QUOTA_RESERVE, burst: int = YOUTUBE_BURST,
+                 rate_per_min: float = YOUTUBE_RATE_PER_MIN):
+        self.db = db
+        self.daily_limit = daily_limit
+        self.reserve = reserve
+        self.burst = burst
+        self.rate = rate_per_min / 60
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._load(self._today())
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(PACIFIC).strftime('%Y-%m-%d')
+
+    def _load(self, day: str):
+        row = self.db.execute_query(
+            'SELECT units, calls, rejected, throttled FROM youtube_quota WHERE day = ?',
+            (day,)
+        ).fetchone()
+        self.day = day
+        self.units, self.calls, self.rejected, self.throttled = row if row else (0, 0, 0, 0)
+
+    def _roll_day(self):
+        day = self._today()
+        if day != self.day:
+            self.day = day
+            self.units = self.calls = self.rejected = self.throttled = 0
+
+    @property
+    def remaining(self) -> int:
+        self._roll_day()
+        return max(0, self.daily_limit - self.units)
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def acquire(self, method: str = 'search', priority: bool = False) -> bool:
+        """Резервирует квоту под один вызов method. False — звать API нельзя"""
+        cost = COSTS[method]
+        available = self.remaining if priority else self.remaining - self.reserve
+        if cost > available:
+            self.rejected += 1
+            allowed = False
+        elif method in RATE_LIMITED and not self._take_token():
+            self.throttled += 1
+            allowed = False
+        else:
+            self.units += cost
+            self.calls += 1
+            allowed = True
+        await self._save()
+        return allowed
+
+    async def refund(self, method: str = 'search'):
+        """Возвращает квоту вызова, который не дошёл до YouTube (сеть, таймаут)"""
+        self._roll_day()
+        self.units = max(0, self.units - COSTS[method])
+        self.calls = max(0, self.calls - 1)
+        await self._save()
+
+    async def exhaust(self):
+        """YouTube ответил quotaExceeded: до конца дня считаем квоту израсходованной"""
+        self._roll_day()
+        if self.units < self.daily_limit:
+            logging.error(f"YouTube сообщил об исчерпании квоты при учтённых {self.units} единицах")
+            self.units = self.daily_limit
+            await self._save()
+
+    async def _save(self):
+        await self.db.write(
+            self.UPSERT_QUERY,
+            (self.day, self.units, self.calls, self.rejected, self.throttled)
+        )
+
+    def stats(self) -> Dict:
+        remaining = self.remaining
+        now = datetime.now(PACIFIC)
+        reset_at = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return {
+            'day': self.day,
+            'units': self.units,
+            'limit': self.daily_limit,
+            'remaining': remaining,
+            'reserve': self.reserve,
+            'calls': self.calls,
+            'rejected': self.rejected,
+            'throttled': self.throttled,
+            'tokens': min(self.burst, self._tokens + (time.monotonic() - self._refilled_at) * self.rate),
+            'reset_in': reset_at - now,
+        }
@@ -0,0 +1,40 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class ResultStore:
+    """Ограниченное хранилище результатов с вытеснением LRU и TTL.
+
+    Размер не превышает max_size, запись живёт не дольше ttl секунд
+    с последнего сохранения.
+    """
+
+    def __init__(self, max_size: int = 5000, ttl: int = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[object]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: object):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Видео, показанные пользователю: (user_id, category) -> список видео
+shown_videos = ResultStore()
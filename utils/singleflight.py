@@ -0,0 +1,26 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые запросы: пока запрос с ключом key
+    выполняется, остальные вызовы с тем же ключом ждут его результата,
+    а не запускают свой. Результат не кэшируется — только общий полёт.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]):
+        task = self._flights.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.create_task(func())
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.shared += 1
+        # shield: отмена одного ожидающего не отменяет запрос остальным
+        return await asyncio.shield(task)
@@ -0,0 +1,22 @@
+# Telegram считает длину сообщения в кодовых единицах UTF-16:
+# эмодзи и другие символы вне BMP занимают две единицы
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024  # подпись к фото и видео
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+def truncate_utf16(text: str, limit: int, ellipsis: str = '…') -> str:
+    """Обрезает текст до limit единиц UTF-16, не разрывая суррогатную пару"""
+    if utf16_len(text) <= limit:
+        return text
+    budget = limit - utf16_len(ellipsis)
+    result = []
+    for char in text:
+        budget -= utf16_len(char)
+        if budget < 0:
+            break
+        result.append(char)
+    return ''.join(result) + ellipsis
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from database import Database
+from config import (EXERCISE_CATEGORIES, EXERCISE_SEARCH_QUERIES, VIDEO_CACHE_TTL, VIDEO_CATALOG_SIZE,
+                    VIDEO_MAX_DURATION, VIDEO_METADATA_TTL)
+from utils.youtube import VIDEOS_BATCH_SIZE, search_youtube_page, fetch_video_metadata
+from utils.quota import QuotaManager
+
+
+class VideoCatalog:
+    """Каталог видео по категориям упражнений поверх таблицы video_cache.
+    Отдаёт сохранённый список сразу, а обновляет его у YouTube в фоне с учётом квоты"""
+
+    def __init__(self, db: Database, quota: Optional[QuotaManager] = None,
+                 ttl: int = VIDEO_CACHE_TTL, size: int = VIDEO_CATALOG_SIZE, retry_delay: int = 300):
+        self.db = db
+        self.quota = quota
+        self.ttl = ttl
+        self.size = size
+        self.retry_delay = retry_delay  # пауза перед повтором неудачного обновления
+        # category -> (видео, время загрузки, токен следующей страницы)
+        self._entries: Dict[str, Tuple[List[Dict], float, Optional[str]]] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._extending: Dict[str, asyncio.Task] = {}
+        self._enriching: Dict[str, asyncio.Task] = {}
+        self._metadata_retry_at: Dict[str, float] = {}
+
+    async def _load(self, category: str) -> Optional[Tuple[List[Dict], float, Optional[str]]]:
+        entry = self._entries.get(category)
+        if entry is None:
+            videos, fetched_at, next_page_token = await self.db.call(self.db.get_cached_videos, category)
+            if fetched_at is not None:
+                entry = self._entries[category] = (videos, fetched_at, next_page_token)
+        return entry
+
+    async def _save(self, category: str, videos: List[Dict], fetched_at: float, next_page_token: Optional[str]):
+        try:
+            await self.db.call(self.db.replace_cached_videos, category, videos, fetched_at, next_page_token)
+        except Exception as e:
+            logging.error(f"Ошибка сохранения каталога видео {category}: {e}")
+        self._entries[category] = (videos, fetched_at, next_page_token)
+
+    async def get(self, category: str) -> List[Dict]:
+        """Видео категории; пустой список — если их нет ни в каталоге, ни на YouTube"""
+        entry = await self._load(category)
+        if entry is None:
+            # Пустую категорию ждём, но вместе с уже идущим обновлением, если оно есть
+            return await asyncio.shield(self._start_refresh(category, priority=True))
+
+        videos, fetched_at, _ = entry
+        if time.time() - fetched_at > self.ttl:
+            self.refresh_in_background(category)
+        elif self._missing_metadata(videos) and time.time() >= self._metadata_retry_at.get(category, 0):
+            self._metadata_retry_at[category] = time.time() + self.retry_delay
+            self._start_task(self._enriching, category, self.fill_metadata(category))
+        return videos
+
+    async def get_page(self, category: str, offset: int, count: int) -> Tuple[List[Dict], int]:
+        """count видео категории начиная с offset и смещение следующей страницы.
+        Если загруженные видео кончились — догружает следующую страницу YouTube,
+        а если и там пусто — начинает сначала"""
+        videos = await self.get(category)
+        if offset + count > len(videos) and self._entries.get(category, (None, None, None))[2]:
+            videos = await asyncio.shield(self._start_task(self._extending, category, self.extend(category)))
+        if offset >= len(videos):
+            offset = 0
+        return videos[offset:offset + count], offset + count
+
+    def find(self, category: str, video_id: str) -> Optional[Dict]:
+        """Ищет видео по ID среди загруженных в память видео категории"""
+        entry = self._entries.get(category)
+        if entry:
+            for video in entry[0]:
+                if video['video_id'] == video_id:
+                    return video
+        return None
+
+    def refresh_in_background(self, category: str):
+        """Запускает обновление категории, если оно ещё не идёт"""
+        self._start_refresh(category)
+
+    def _start_refresh(self, category: str, priority: bool = False) -> asyncio.Task:
+        return self._start_task(self._refreshing, category, self.refresh(category, priority))
+
+    @staticmethod
+    def _start_task(tasks: Dict[str, asyncio.Task], category: str, coro) -> asyncio.Task:
+        """Одна задача на категорию: пока она идёт, новые вызовы получают её же"""
+        task = tasks.get(category)
+        if task is None:
+            task = asyncio.create_task(coro)
+            tasks[category] = task
+            task.add_done_callback(lambda _: tasks.pop(category, None))
+        else:
+            coro.close()
+        return task
+
+    async def _enrich(self, videos: List[Dict]) -> List[Dict]:
+        """Добавляет к видео метаданные и отбрасывает трансляции и слишком длинные"""
+        video_ids = [video['video_id'] for video in videos]
+        known = await self.db.call(self.db.get_video_metadata, video_ids, VIDEO_METADATA_TTL)
+        metadata = {
+            video_id: {'duration': row['duration'], 'views': row['view_count'], 'channel': row['channel_title']}
+            for video_id, row in known.items()
+        }
+        missing = [video_id for video_id in video_ids if video_id not in metadata]
+        if missing:
+            # Вызывающие передают не больше VIDEOS_BATCH_SIZE видео — один запрос videos.list
+            fetched = await fetch_video_metadata(missing, quota=self.quota)
+            if fetched:
+                try:
+                    await self.db.call(self.db.save_video_metadata, fetched)
+                except Exception as e:
+                    logging.error(f"Ошибка сохранения метаданных видео: {e}")
+                metadata.update(fetched)
+
+        enriched = []
+        for video in videos:
+            video = {**video, **metadata.get(video['video_id'], {'duration': None, 'views': None, 'channel': None})}
+            # Без метаданных (квота, ошибка API) видео оставляем
+            duration = video['duration']
+            if duration is not None and (duration == 0 or duration > VIDEO_MAX_DURATION):
+                continue
+            enriched.append(video)
+        return enriched
+
+    def _current(self, category: str, entry: Tuple[List[Dict], float, Optional[str]]):
+        """Актуальная запись категории: пока шёл запрос к YouTube, её могли обновить"""
+        return self._entries.get(category, entry)
+
+    @staticmethod
+    def _missing_metadata(videos: List[Dict]) -> List[Dict]:
+        return [video for video in videos if video.get('duration') is None]
+
+    async def fill_metadata(self, category: str):
+        """Дозапрашивает метаданные видео категории, для которых их не удалось получить.
+        За раз — одна пачка videos.list, остальные при следующих открытиях"""
+        entry = self._entries.get(category)
+        missing = self._missing_metadata(entry[0])[:VIDEOS_BATCH_SIZE] if entry else []
+        if not missing:
+            return
+        enriched = {video['video_id']: video for video in await self._enrich(missing)}
+        dropped = {video['video_id'] for video in missing} - enriched.keys()
+        if not dropped and all(video['duration'] is None for video in enriched.values()):
+            return  # Квота или ошибка API: попробуем при следующем открытии
+        videos, fetched_at, next_page_token = self._current(category, entry)
+        videos = [enriched.get(video['video_id'], video) for video in videos if video['video_id'] not in dropped]
+        await self._save(category, videos, fetched_at, next_page_token)
+
+    async def extend(self, category: str) -> List[Dict]:
+        """Догружает следующую страницу результатов и добавляет новые видео в конец"""
+        entry = await self._load(category)
+        if not entry or not entry[2]:
+            return entry[0] if entry else []
+        page, next_page_token = await search_youtube_page(
+            EXERCISE_SEARCH_QUERIES[category], max_results=self.size,
+            page_token=entry[2], quota=self.quota
+        )
+        if not page:
+            return entry[0]
+        page = await self._enrich(page)
+        videos, fetched_at, _ = self._current(category, entry)
+        known = {video['video_id'] for video in videos}
+        videos = videos + [video for video in page if video['video_id'] not in known]
+        await self._save(category, videos, fetched_at, next_page_token)
+        return videos
+
+    async def refresh(self, category: str, priority: bool = False) -> List[Dict]:
+        """Запрашивает категорию у YouTube и сохраняет в каталог.
+        При неудаче возвращает прежний список. priority — может тратить резерв квоты"""
+        videos, next_page_token = await search_youtube_page(
+            EXERCISE_SEARCH_QUERIES[category], max_results=self.size,
+            quota=self.quota, priority=priority
+        )
+        videos = await self._enrich(videos) if videos else videos
+        if videos:
+            await self._save(category, videos, time.time(), next_page_token)
+            return videos
+
+        entry = await self._load(category)
+        if entry:
+            logging.warning(f"Не удалось обновить видео категории {category}, отдаём сохранённые")
+            # Следующая попытка — через retry_delay, а не на каждом открытии категории
+            self._entries[category] = (entry[0], time.time() - self.ttl + self.retry_delay, entry[2])
+            return entry[0]
+        return []
+
+    async def warm_up(self, concurrency: int = 4) -> Dict[str, Dict]:
+        """Заполняет каталог всех категорий перед стартом: свежие берутся из БД,
+        остальные запрашиваются у YouTube, не больше concurrency запросов сразу.
+        Возвращает отчёт по категориям; ошибки не пробрасываются"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def warm(category: str) -> Dict:
+            started = time.perf_counter()
+            source = 'cache'
+            try:
+                entry = await self._load(category)
+                error = None
+                if entry is None or time.time() - entry[1] > self.ttl:
+                    source = 'youtube'
+                    async with semaphore:
+                        # Ожидание очереди не считаем временем загрузки
+                        started = time.perf_counter()
+                        requested_at = time.time()
+                        videos = await self.refresh(category, priority=entry is None)
+                    # refresh не бросает исключений: отказ квоты, частоты или API
+                    # виден только по тому, что каталог не обновился
+                    refreshed = self._entries.get(category)
+                    if not videos:
+                        error = 'YouTube не вернул видео (квота, лимит частоты или ошибка API)'
+                    elif refreshed is None or refreshed[1] < requested_at:
+                        error = 'не удалось обновить, отдан сохранённый список'
+                    elif self._missing_metadata(videos):
+                        error = f'нет метаданных у {len(self._missing_metadata(videos))} видео'
+                else:
+                    videos = entry[0]
+                result = {'source': source, 'videos': len(videos)}
+                if error:
+                    result['error'] = error
+            except Exception as e:
+                result = {'source': source, 'videos': 0, 'error': str(e)}
+            result['elapsed_ms'] = (time.perf_counter() - started) * 1000
+            return result
+
+        results = await asyncio.gather(*(warm(category) for category in EXERCISE_CATEGORIES))
+        report = dict(zip(EXERCISE_CATEGORIES, results))
+        for category, result in report.items():
+            logging.info(
+                f"Прогрев видео {category}: {result['videos']} шт. из {result['source']} "
+                f"за {result['elapsed_ms']:.0f} мс" + (f", ошибка: {result['error']}" if 'error' in result else '')
+            )
+        return report
@@ -1,41 +1,165 @@
-from config import YOUTUBE_API_KEY
+import asyncio
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import httplib2
+from config import YOUTUBE_API_KEY, YOUTUBE_TIMEOUT
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from utils.singleflight import SingleFlight
 
-def search_youtube_video(query: str, max_results=5, force_update=False):
+# googleapiclient синхронный: запросы выполняются в отдельных потоках,
+# чтобы медленный ответ YouTube не останавливал event loop
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="youtube")
+# Http из httplib2 не потокобезопасен, поэтому клиент свой у каждого потока.
+# Строится один раз на поток, а не на каждый запрос
+_local = threading.local()
+# Одинаковые одновременные поиски (группа открыла одну категорию) — один запрос к API
+search_flights = SingleFlight()
+
+
+def _get_client():
+    client = getattr(_local, 'client', None)
+    if client is None:
+        client = build(
+            'youtube', 'v3',
+            developerKey=YOUTUBE_API_KEY,
+            http=httplib2.Http(timeout=YOUTUBE_TIMEOUT),
+            cache_discovery=False
+        )
+        _local.client = client
+    return client
+
+
+def _search(query: str, max_results: int, page_token: Optional[str]) -> Tuple[list, Optional[str]]:
+    search_response = _get_client().search().list(
+        q=query,
+        part='snippet',
+        maxResults=max_results,
+        pageToken=page_token,
+        type='video',
+        relevanceLanguage='ru',
+        safeSearch='strict',
+        order='relevance'  # Можно использовать 'date' для новых видео
+    ).execute()
+
+    videos = []
+    for item in search_response['items']:
+        video_data = {
+            'title': item['snippet']['title'],
+            'video_id': item['id']['videoId'],
+            'thumbnail': item['snippet']['thumbnails']['default']['url'],
+            'url': f"https://www.youtube.com/watch?v={item['id']['videoId']}"
+        }
+        videos.append(video_data)
+
+    return videos, search_response.get('nextPageToken')
+
+
+# Максимум ID в одном запросе videos.list
+VIDEOS_BATCH_SIZE = 50
+_DURATION = re.compile(r'P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?')
+
+
+def parse_duration(value: str) -> Optional[int]:
+    """ISO 8601 длительность YouTube (PT1H2M3S) -> секунды"""
+    match = _DURATION.fullmatch(value or '')
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def _videos(video_ids: List[str]) -> Dict[str, Dict]:
+    response = _get_client().videos().list(
+        id=','.join(video_ids),
+        part='contentDetails,statistics,snippet',
+        maxResults=len(video_ids)
+    ).execute()
+
+    metadata = {}
+    for item in response['items']:
+        views = item.get('statistics', {}).get('viewCount')
+        metadata[item['id']] = {
+            'duration': parse_duration(item['contentDetails'].get('duration')),
+            'views': int(views) if views is not None else None,
+            'channel': item['snippet'].get('channelTitle'),
+        }
+    return metadata
+
+
+async def fetch_video_metadata(video_ids: List[str], timeout: float = YOUTUBE_TIMEOUT,
+                               quota=None) -> Dict[str, Dict]:
+    """Длительность, просмотры и канал видео: video_id -> данные.
+    Запрашивает пачками по VIDEOS_BATCH_SIZE ID (1 единица квоты на пачку).
+    Пачки, которые не удалось получить, в результат не попадают"""
+    loop = asyncio.get_running_loop()
+    metadata = {}
+    for start in range(0, len(video_ids), VIDEOS_BATCH_SIZE):
+        batch = video_ids[start:start + VIDEOS_BATCH_SIZE]
+        if quota is not None and not await quota.acquire('videos'):
+            logging.warning("Метаданные видео не запрошены: лимит квоты YouTube")
+            break
+        try:
+            metadata.update(await asyncio.wait_for(
+                loop.run_in_executor(_executor, _videos, batch),
+                timeout=timeout
+            ))
+        except HttpError as e:
+            if quota is not None and b'quotaExceeded' in (e.content or b''):
+                await quota.exhaust()
+            print(f"Ошибка при получении метаданных видео: {e}")
+        except Exception as e:
+            # Запрос не дошёл до YouTube — квоту не тратим
+            if quota is not None:
+                await quota.refund('videos')
+            if isinstance(e, asyncio.TimeoutError):
+                logging.warning(f"YouTube не ответил за {timeout} с на запрос метаданных")
+            else:
+                print(f"Ошибка при получении метаданных видео: {e}")
+    return metadata
+
+
+async def search_youtube_page(query: str, max_results: int = 50, page_token: Optional[str] = None,
+                              timeout: float = YOUTUBE_TIMEOUT, quota=None,
+                              priority: bool = False) -> Tuple[list, Optional[str]]:
+    """Ищет видео на YouTube, не блокируя event loop. Возвращает страницу результатов
+    и токен следующей страницы (None — страниц больше нет).
+    При ошибке, превышении timeout секунд или отказе quota (QuotaManager)
+    возвращает ([], None). Одновременные одинаковые поиски выполняются один раз"""
+    return await search_flights.do(
+        # priority в ключе: отказ обычному поиску по квоте не должен
+        # достаться приоритетному, которому доступен резерв
+        (query, max_results, page_token, priority),
+        lambda: _search_async(query, max_results, page_token, timeout, quota, priority)
+    )
+
+
+async def _search_async(query: str, max_results: int, page_token: Optional[str], timeout: float,
+                        quota, priority: bool) -> Tuple[list, Optional[str]]:
+    if quota is not None and not await quota.acquire('search', priority):
+        logging.warning(f"Поиск «{query}» не выполнен: лимит квоты YouTube")
+        return [], None
+
+    loop = asyncio.get_running_loop()
     try:
-        youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-        
-        # Добавляем случайное смещение при обновлении
-        if force_update:
-            from random import randint
-            offset = randint(1, 10)
-        else:
-            offset = 0
-            
-        search_response = youtube.search().list(
-            q=query,
-            part='snippet',
-            maxResults=max_results + offset,  # Увеличиваем количество результатов
-            type='video',
-            relevanceLanguage='ru',
-            safeSearch='strict',
-            order='relevance'  # Можно использовать 'date' для новых видео
-        ).execute()
-
-        videos = []
-        # Пропускаем первые offset видео при обновлении
-        items = search_response['items'][offset:offset + max_results]
-        for item in items:
-            video_data = {
-                'title': item['snippet']['title'],
-                'video_id': item['id']['videoId'],
-                'thumbnail': item['snippet']['thumbnails']['default']['url'],
-                'url': f"https://www.youtube.com/watch?v={item['id']['videoId']}"
-            }
-            videos.append(video_data)
-        
-        return videos
-    
-    except Exception as e:
+        return await asyncio.wait_for(
+            loop.run_in_executor(_executor, _search, query, max_results, page_token),
+            timeout=timeout
+        )
+    except HttpError as e:
+        if quota is not None and b'quotaExceeded' in (e.content or b''):
+            await quota.exhaust()
         print(f"Ошибка при поиске видео: {e}")
-        return []
\ No newline at end of file
+        return [], None
+    except Exception as e:
+        # Запрос не дошёл до YouTube — квоту не тратим
+        if quota is not None:
+            await quota.refund('search')
+        if isinstance(e, asyncio.TimeoutError):
+            logging.warning(f"YouTube не ответил за {timeout} с на запрос «{query}»")
+        else:
+            print(f"Ошибка при поиске видео: {e}")
+        return [], None